@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, BigInteger, Integer, String, Text, ForeignKey, DateTime, Date, Boolean, Index, Float
 from sqlalchemy.orm import relationship
 
 from database.database import Base
@@ -21,6 +21,11 @@ class Post(Base):
     # Relationships
     matches = relationship("Match", back_populates="posts")
 
+    __table_args__ = (
+        Index('ix_posts_user_name', 'user_name'),
+        Index('ix_posts_timestamp_id', 'timestamp', 'id'),
+    )
+
     def __repr__(self):
         return f"<Post(id={self.id}, user_name={self.user_name})>"
 
@@ -32,16 +37,53 @@ class Search(Base):
     id = Column(Integer, primary_key=True)  # Changed from String to Integer
     name = Column(String(255), nullable=False)
     type = Column(String(50), nullable=False)  # Can be user, company, topic, or job
-    usernames = Column(Text, nullable=True)
-    keywords = Column(Text, nullable=True)  # String to store keywords or usernames
     notify = Column(Boolean, default=False)
+    interval_minutes = Column(Integer, nullable=True)  # How often the monitor runs the search, None for its default
+    version = Column(Integer, nullable=False, default=1, server_default='1')  # Bumped when the criteria change
 
     matches = relationship("Match")
+    terms = relationship("SearchTerm", order_by="SearchTerm.position", cascade="all, delete-orphan")
+    users = relationship("SearchUser", order_by="SearchUser.position", cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<Search(id={self.id}, name='{self.name}', type='{self.type}')>"
 
 
+# Define the SearchTerms table
+class SearchTerm(Base):
+    __tablename__ = 'search_terms'
+
+    id = Column(Integer, primary_key=True)
+    search_id = Column(Integer, ForeignKey('searches.id'), nullable=False)
+    position = Column(Integer, nullable=False)  # Order in which the terms were entered
+    term = Column(String(255), nullable=False)  # Keyword matched as a case-insensitive substring
+
+    __table_args__ = (
+        Index('ix_search_terms_search_id', 'search_id'),
+    )
+
+    def __repr__(self):
+        return f"<SearchTerm(search_id={self.search_id}, term='{self.term}')>"
+
+
+# Define the SearchUsers table
+class SearchUser(Base):
+    __tablename__ = 'search_users'
+
+    id = Column(Integer, primary_key=True)
+    search_id = Column(Integer, ForeignKey('searches.id'), nullable=False)
+    position = Column(Integer, nullable=False)  # Order in which the users were entered
+    user_name = Column(String(255), nullable=False)  # Matched exactly against posts.user_name
+
+    __table_args__ = (
+        Index('uq_search_users_search_id_user_name', 'search_id', 'user_name', unique=True),
+        Index('ix_search_users_user_name', 'user_name'),
+    )
+
+    def __repr__(self):
+        return f"<SearchUser(search_id={self.search_id}, user_name='{self.user_name}')>"
+
+
 # Define the Matches table
 class Match(Base):
     __tablename__ = 'matches'
@@ -50,9 +92,157 @@ class Match(Base):
     search_id = Column(Integer, ForeignKey('searches.id'), nullable=False)
     post_id = Column(Integer, ForeignKey('posts.id'), nullable=False)
     matched_at = Column(DateTime, nullable=False)
+    # Precomputed ranking score, see modules/relevance.py
+    relevance = Column(Float, nullable=False, default=0.0, server_default='0')
 
     posts = relationship("Post", back_populates="matches")
     searches = relationship("Search", back_populates="matches")
 
+    __table_args__ = (
+        Index('ix_matches_search_id_matched_at', 'search_id', 'matched_at'),
+        Index('ix_matches_search_id_relevance', 'search_id', 'relevance'),
+        Index('ix_matches_post_id', 'post_id'),
+        Index('uq_matches_search_id_post_id', 'search_id', 'post_id', unique=True),
+    )
+
     def __repr__(self):
         return f"<Match(id={self.id}, search_id={self.search_id}, post_id={self.post_id}, matched_at={self.matched_at})>"
+
+
+# Define the SearchStats table, the per-search rollup of the matches
+class SearchStats(Base):
+    __tablename__ = 'search_stats'
+
+    search_id = Column(Integer, ForeignKey('searches.id'), primary_key=True)
+    matches = Column(Integer, nullable=False)
+    last_matched_at = Column(DateTime, nullable=True)  # None while the search has no matches
+
+    def __repr__(self):
+        return f"<SearchStats(search_id={self.search_id}, matches={self.matches})>"
+
+
+# Define the SearchDailyStats table, the per-search and per-day rollup of the matches
+class SearchDailyStats(Base):
+    __tablename__ = 'search_daily_stats'
+
+    search_id = Column(Integer, ForeignKey('searches.id'), primary_key=True)
+    day = Column(Date, primary_key=True)  # Publication day of the matched posts
+    matches = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<SearchDailyStats(search_id={self.search_id}, day={self.day}, matches={self.matches})>"
+
+
+# Define the SearchAuthorStats table, the per-search and per-author rollup of the matches
+class SearchAuthorStats(Base):
+    __tablename__ = 'search_author_stats'
+
+    search_id = Column(Integer, ForeignKey('searches.id'), primary_key=True)
+    user_name = Column(String(255), primary_key=True)  # Author of the matched posts; posts without one are not counted
+    matches = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('ix_search_author_stats_search_id_matches', 'search_id', 'matches'),
+    )
+
+    def __repr__(self):
+        return f"<SearchAuthorStats(search_id={self.search_id}, user_name='{self.user_name}', matches={self.matches})>"
+
+
+# Define the SearchWatermarks table
+class SearchWatermark(Base):
+    __tablename__ = 'search_watermarks'
+
+    search_id = Column(Integer, ForeignKey('searches.id'), primary_key=True)
+    last_post_id = Column(Integer, nullable=False)  # Highest post id evaluated by the last run
+    last_run_at = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<SearchWatermark(search_id={self.search_id}, last_post_id={self.last_post_id}, last_run_at={self.last_run_at})>"
+
+
+# Define the Jobs table
+class Job(Base):
+    __tablename__ = 'jobs'
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)  # Can be search or all_searches
+    search_id = Column(Integer, nullable=True)  # Set for kind == 'search'
+    full_rebuild = Column(Boolean, default=False)
+    status = Column(String(20), nullable=False)  # Can be queued, running, succeeded or failed
+    progress = Column(Float, default=0.0)  # Fraction of the work done, from 0 to 1
+    result = Column(Text, nullable=True)  # JSON summary on success, error message on failure
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_jobs_status', 'status'),
+    )
+
+    def __repr__(self):
+        return f"<Job(id={self.id}, kind='{self.kind}', status='{self.status}', progress={self.progress})>"
+
+
+# Define the PostSignatures table
+class PostSignature(Base):
+    __tablename__ = 'post_signatures'
+
+    post_id = Column(Integer, ForeignKey('posts.id'), primary_key=True)
+    simhash = Column(BigInteger, nullable=False)  # 64-bit SimHash of the content, stored as a signed integer
+    # The SimHash split into four 16-bit bands: posts within 3 bits of each other share at least one band
+    band0 = Column(Integer, nullable=False)
+    band1 = Column(Integer, nullable=False)
+    band2 = Column(Integer, nullable=False)
+    band3 = Column(Integer, nullable=False)
+    canonical_post_id = Column(Integer, ForeignKey('posts.id'), nullable=True)  # Set for near-duplicates
+
+    __table_args__ = (
+        Index('ix_post_signatures_band0', 'band0'),
+        Index('ix_post_signatures_band1', 'band1'),
+        Index('ix_post_signatures_band2', 'band2'),
+        Index('ix_post_signatures_band3', 'band3'),
+        Index('ix_post_signatures_canonical_post_id', 'canonical_post_id'),
+    )
+
+    def __repr__(self):
+        return f"<PostSignature(post_id={self.post_id}, canonical_post_id={self.canonical_post_id})>"
+
+
+# Define the PostEngagementSnapshots table
+class PostEngagementSnapshot(Base):
+    __tablename__ = 'post_engagement_snapshots'
+
+    post_id = Column(Integer, ForeignKey('posts.id'), primary_key=True)
+    captured_at = Column(Integer, primary_key=True)  # Unix time in seconds
+    likes = Column(Integer, nullable=False)
+    comments = Column(Integer, nullable=False)
+    shares = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('ix_post_engagement_snapshots_captured_at', 'captured_at'),
+        # Rows are clustered by (post_id, captured_at), so the series of a post is contiguous on disk
+        {'sqlite_with_rowid': False},
+    )
+
+    def __repr__(self):
+        return f"<PostEngagementSnapshot(post_id={self.post_id}, captured_at={self.captured_at})>"
+
+
+# Define the PostEngagement table, the per-post rollup of the snapshots
+class PostEngagement(Base):
+    __tablename__ = 'post_engagement'
+
+    post_id = Column(Integer, ForeignKey('posts.id'), primary_key=True)
+    snapshots = Column(Integer, nullable=False)  # Number of snapshots taken, including compacted ones
+    first_captured_at = Column(Integer, nullable=False)  # Unix time of the first snapshot
+    last_captured_at = Column(Integer, nullable=False)  # Unix time of the latest snapshot
+    interactions = Column(Integer, nullable=False)  # Likes, comments and shares at the latest snapshot
+    growth_per_hour = Column(Float, nullable=False)  # Time-decayed average of interactions gained per hour
+
+    __table_args__ = (
+        Index('ix_post_engagement_growth_per_hour', 'growth_per_hour'),
+    )
+
+    def __repr__(self):
+        return f"<PostEngagement(post_id={self.post_id}, growth_per_hour={self.growth_per_hour})>"
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+LinkedIn monitor.
+Periodically ingests new posts and runs the saved searches incrementally, as the
+Scheduling Service of documentations/design.md.
+"""
+import argparse
+import logging
+import signal
+
+from database.database import database_url_from_env
+from modules.dedup import DuplicateFilter, MARK, SKIP
+from modules.monitor import (Monitor, FixtureSource, DEFAULT_SEARCH_INTERVAL, DEFAULT_INGEST_INTERVAL,
+                             DEFAULT_JITTER, DEFAULT_MAX_CONCURRENT)
+from modules.notifications import dispatcher_from_env
+from modules.storage import DatabaseStorage
+
+
+def list_searches(storage: DatabaseStorage, monitor: Monitor):
+    searches = storage.get_all_searches()
+    print(f"Found {len(searches)} searches:")
+    for search in searches:
+        watermark = storage.get_watermark(search.id)
+        last_run = watermark.last_run_at.strftime('%Y-%m-%d %H:%M') if watermark else 'never'
+        print(f"- {search.id}: {search.name} ({search.type}), every {monitor.interval_for(search)} min, "
+              f"last run {last_run}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default=database_url_from_env(),
+                        help="database connection string, selecting the backend (default: $DATABASE_URL or SQLite)")
+    parser.add_argument("--fixtures", help="JSON/JSONL file, directory or glob pattern to ingest posts from")
+    parser.add_argument("--dedupe", choices=[MARK, SKIP],
+                        help="detect near-duplicate posts and mark them (linked to the original) or skip them")
+    parser.add_argument("--interval", type=float, default=DEFAULT_SEARCH_INTERVAL,
+                        help="minutes between runs of searches without their own interval")
+    parser.add_argument("--ingest-interval", type=float, default=DEFAULT_INGEST_INTERVAL,
+                        help="minutes between polls of the post source")
+    parser.add_argument("--jitter", type=float, default=DEFAULT_JITTER,
+                        help="fraction by which intervals are randomly stretched or shortened")
+    parser.add_argument("--max-concurrent", type=int, default=DEFAULT_MAX_CONCURRENT,
+                        help="maximum number of search passes running at the same time")
+    parser.add_argument("--in-database", action="store_true",
+                        help="match searches with INSERT ... SELECT statements instead of scanning posts in Python")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes matching posts in parallel during large search passes")
+    parser.add_argument("--list-searches", action="store_true", help="list the saved searches and exit")
+    parser.add_argument("--once", action="store_true", help="ingest and run every search once, then exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    storage = DatabaseStorage(args.db)
+    source = FixtureSource(args.fixtures) if args.fixtures else None
+    duplicate_filter = DuplicateFilter(storage, mode=args.dedupe) if args.dedupe else None
+    if duplicate_filter is not None:
+        logging.info("Signed %d previously loaded posts", duplicate_filter.backfill())
+    # Senders are configured through NOTIFY_* environment variables, see modules/notifications.py
+    notifier = dispatcher_from_env(storage)
+    monitor = Monitor(storage, source, default_interval=args.interval, ingest_interval=args.ingest_interval,
+                      jitter=args.jitter, max_concurrent=args.max_concurrent, notifier=notifier,
+                      in_database=args.in_database, workers=args.workers, duplicate_filter=duplicate_filter)
+
+    if args.list_searches:
+        list_searches(storage, monitor)
+        return
+
+    try:
+        if args.once:
+            counts = monitor.run_once()
+            print(f"Ran {len(counts)} searches, {sum(counts.values())} new matches")
+            return
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: monitor.stop())
+        try:
+            monitor.run_forever()
+        except KeyboardInterrupt:
+            monitor.stop()
+    finally:
+        monitor.stop()
+        if notifier is not None:
+            notifier.close()
+
+
+if __name__ == "__main__":
+    main()
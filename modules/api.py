@@ -0,0 +1,202 @@
+import csv
+import io
+import json
+from dataclasses import asdict, fields
+from datetime import datetime
+
+from flask import Blueprint, Response, jsonify, request
+
+from modules.read_models import PostView, MatchView
+from modules.storage import DatabaseStorage, MATCH_SORTS, SORT_RECENT
+
+# Items per page when the client does not ask for a page size
+DEFAULT_PAGE_SIZE = 20
+
+# Largest page size a client can ask for
+MAX_PAGE_SIZE = 100
+
+# Export formats and their content types
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# Rows serialized per chunk of a streamed export
+EXPORT_CHUNK_SIZE = 500
+
+
+def _json_value(value):
+    if isinstance(value, dict):
+        return {key: _json_value(item) for key, item in value.items()}
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def to_dict(view):
+    """
+    Convert a read model to a JSON-serializable dictionary, with datetimes in ISO 8601
+    """
+    return _json_value(asdict(view))
+
+
+def _csv_header(view_class):
+    header = []
+    for field in fields(view_class):
+        if field.name == 'post':
+            header += [f'post_{name}' for name in (f.name for f in fields(PostView)) if name != 'id']
+        else:
+            header.append(field.name)
+    return header
+
+
+def _csv_row(view):
+    row = []
+    for field in fields(view):
+        value = getattr(view, field.name)
+        if field.name == 'post':
+            # The post ID is already in the match's post_id column
+            row += [getattr(value, f.name) if value else None for f in fields(PostView) if f.name != 'id']
+        else:
+            row.append(value)
+    return [v.isoformat() if isinstance(v, datetime) else v for v in row]
+
+
+def stream_export(views, view_class, export_format):
+    """
+    Serialize an iterable of read models as NDJSON or CSV, chunk by chunk
+
+    Args:
+        views (Iterable): The read models, e.g. from DatabaseStorage.iter_matches
+        view_class (type): The read model class, for the CSV header
+        export_format (str): 'ndjson' or 'csv'
+
+    Yields:
+        str: Chunks of the export
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == 'csv' else None
+    if writer is not None:
+        writer.writerow(_csv_header(view_class))
+    count = 0
+    for view in views:
+        if writer is not None:
+            writer.writerow(_csv_row(view))
+        else:
+            buffer.write(json.dumps(to_dict(view)))
+            buffer.write('\n')
+        count += 1
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _page_size():
+    per_page = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    return min(max(per_page, 1), MAX_PAGE_SIZE)
+
+
+def _page(items, next_cursor, prev_cursor):
+    return jsonify({
+        'items': [to_dict(item) for item in items],
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+    })
+
+
+def _datetime_arg(name):
+    # Raises ValueError for a value that is not ISO 8601
+    value = request.args.get(name)
+    return datetime.fromisoformat(value) if value else None
+
+
+def _not_found(message):
+    return jsonify({'error': message}), 404
+
+
+def _export_response(views, view_class, filename):
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format '{export_format}', use one of {sorted(EXPORT_FORMATS)}"}), 400
+    return Response(stream_export(views, view_class, export_format), mimetype=EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename={filename}.{export_format}'})
+
+
+def create_api(storage: DatabaseStorage) -> Blueprint:
+    """
+    Build the JSON API blueprint
+
+    List endpoints are paginated with the same opaque cursors as the HTML pages: pass the
+    next_cursor or prev_cursor of a response as ?cursor= to get the neighbouring page, and
+    ?limit= to set the page size; matches can be ranked with ?sort=relevance. Export endpoints stream every row as NDJSON (default) or
+    CSV (?format=csv) straight from a server-side cursor, in constant memory. Engagement
+    endpoints serve a post's snapshot series (?start= and ?end= in ISO 8601) and the
+    fastest-growing posts overall or of a search, ranked from the engagement rollup.
+
+    Args:
+        storage (DatabaseStorage): The storage to serve data from
+
+    Returns:
+        Blueprint: The blueprint, to be registered under /api
+    """
+    api = Blueprint('api', __name__)
+
+    @api.route('/searches')
+    def list_searches():
+        return jsonify({'items': [to_dict(search) for search in storage.get_all_searches()]})
+
+    @api.route('/searches/<int:search_id>')
+    def get_search(search_id):
+        search = storage.get_search(search_id)
+        if search is None:
+            return _not_found('Search not found')
+        return jsonify(to_dict(search))
+
+    @api.route('/searches/<int:search_id>/matches')
+    def list_matches(search_id):
+        if storage.get_search(search_id) is None:
+            return _not_found('Search not found')
+        sort = request.args.get('sort', SORT_RECENT)
+        if sort not in MATCH_SORTS:
+            return jsonify({'error': f"Unknown sort '{sort}', use one of {list(MATCH_SORTS)}"}), 400
+        return _page(*storage.get_matches_page(search_id, cursor=request.args.get('cursor'), per_page=_page_size(),
+                                               sort=sort))
+
+    @api.route('/searches/<int:search_id>/matches/export')
+    def export_matches(search_id):
+        if storage.get_search(search_id) is None:
+            return _not_found('Search not found')
+        return _export_response(storage.iter_matches(search_id), MatchView, f'matches-{search_id}')
+
+    @api.route('/searches/<int:search_id>/fastest_growing')
+    def fastest_growing_matches(search_id):
+        if storage.get_search(search_id) is None:
+            return _not_found('Search not found')
+        return jsonify({'items': [to_dict(post) for post in
+                                  storage.get_fastest_growing_posts(search_id, limit=_page_size())]})
+
+    @api.route('/posts')
+    def list_posts():
+        return _page(*storage.get_posts_page(cursor=request.args.get('cursor'), per_page=_page_size()))
+
+    @api.route('/posts/export')
+    def export_posts():
+        return _export_response(storage.iter_posts(), PostView, 'posts')
+
+    @api.route('/posts/fastest_growing')
+    def fastest_growing_posts():
+        return jsonify({'items': [to_dict(post) for post in storage.get_fastest_growing_posts(limit=_page_size())]})
+
+    @api.route('/posts/<int:post_id>/engagement')
+    def post_engagement(post_id):
+        try:
+            start, end = _datetime_arg('start'), _datetime_arg('end')
+        except ValueError:
+            return jsonify({'error': 'start and end must be ISO 8601 dates'}), 400
+        return jsonify({'items': [to_dict(snapshot) for snapshot in
+                                  storage.get_engagement_history(post_id, start=start, end=end)]})
+
+    return api
@@ -0,0 +1,209 @@
+from typing import Dict, Iterable
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.util import greenlet_spawn
+
+from database.database import (DatabaseConfig, database_url_from_env, engine_options, apply_connection_settings,
+                               prepare_database)
+from modules.ingestion import ingest_records, IngestionStats, DEFAULT_BATCH_SIZE
+from modules.search_runner import run_search, run_all_searches
+from modules.storage import DatabaseStorage, SORT_RECENT
+
+# Async driver replacing each sync driver a connection URL may name; needs pip install '.[async]'
+ASYNC_DRIVERS = {
+    'pysqlite': 'aiosqlite',
+    'psycopg2': 'asyncpg',
+    'pg8000': 'asyncpg',
+    'psycopg': 'psycopg_async',
+}
+
+
+def async_database_url(db_path: str) -> str:
+    """
+    Get the async driver counterpart of a connection string
+
+    Args:
+        db_path (str): Database connection string, e.g. sqlite:///linkedin_data.db
+
+    Returns:
+        str: The connection string with an async driver, e.g. sqlite+aiosqlite:///linkedin_data.db;
+        strings already naming an async driver are returned unchanged
+    """
+    url = make_url(db_path)
+    driver = ASYNC_DRIVERS.get(url.get_driver_name())
+    if driver is None:
+        return db_path
+    return url.set(drivername=f'{url.get_backend_name()}+{driver}').render_as_string(hide_password=False)
+
+
+def create_configured_async_engine(db_path: str, config: DatabaseConfig = None) -> AsyncEngine:
+    """
+    Create an async engine with the pool and per-connection settings of a DatabaseConfig
+
+    Args:
+        db_path (str): Database connection string naming an async driver, see async_database_url
+        config (DatabaseConfig): Connection settings. Defaults to DatabaseConfig().
+
+    Returns:
+        AsyncEngine: The configured engine
+    """
+    engine = create_async_engine(db_path, **engine_options(db_path, config))
+    apply_connection_settings(engine.sync_engine, config)
+    return engine
+
+
+class AsyncDatabaseStorage:
+    """
+    asyncio counterpart of DatabaseStorage, covering post ingestion, search runs and paginated reads
+
+    Runs on an SQLAlchemy async engine (aiosqlite on SQLite, asyncpg on PostgreSQL), so the
+    database I/O of many tasks overlaps on one event loop: a scraper can write posts while
+    a search run reads them. The statements are those of DatabaseStorage, whose methods run
+    in a greenlet, as AsyncSession.run_sync does: their queries are awaited on the async
+    driver instead of blocking the loop. Python-side work, such as matching posts in memory during
+    run_all_searches, still runs on the event loop between queries.
+
+    Call setup() before anything else, or use the storage as an async context manager.
+    """
+
+    def __init__(self, db_path=None, config: DatabaseConfig = None):
+        """
+        Create the async engine; nothing is connected before setup()
+
+        Args:
+            db_path (str): Database connection string, with a sync or async driver. Defaults to
+                DATABASE_URL, see database_url_from_env.
+            config (DatabaseConfig): Connection pool and SQLite pragma settings
+        """
+        self.engine = create_configured_async_engine(async_database_url(db_path or database_url_from_env()), config)
+        self.storage = None
+
+    async def setup(self):
+        """
+        Create missing tables and apply pending migrations, like setup_database
+        """
+        def prepare(engine):
+            prepare_database(engine)
+            return DatabaseStorage(engine=engine)
+
+        self.storage = await self._run(prepare, self.engine.sync_engine)
+
+    async def close(self):
+        """
+        Close the pooled connections
+        """
+        await self.engine.dispose()
+
+    async def __aenter__(self):
+        await self.setup()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _run(self, function, *args, **kwargs):
+        # Every query of the sync code run in this greenlet awaits the async driver. DatabaseStorage opens its
+        # own sessions on engine.sync_engine, so no AsyncSession is needed around the call.
+        return await greenlet_spawn(function, *args, **kwargs)
+
+    async def upsert_posts(self, posts: list[Dict]):
+        """
+        Insert or update a batch of posts in a single transaction, see DatabaseStorage.upsert_posts
+
+        Returns:
+            int: The number of rows written
+        """
+        return await self._run(self.storage.upsert_posts, posts)
+
+    async def ingest_records(self, records: Iterable[Dict], batch_size=DEFAULT_BATCH_SIZE, duplicate_filter=None,
+                             track_engagement=True) -> IngestionStats:
+        """
+        Upsert scraped post records in batches, see modules.ingestion.ingest_records
+
+        Args:
+            records (Iterable[dict]): The scraped records, already in memory
+            batch_size (int): The number of posts written per transaction
+            duplicate_filter (DuplicateFilter): Optional near-duplicate filter, see modules/dedup.py
+            track_engagement (bool): Append an engagement snapshot of every written post
+
+        Returns:
+            IngestionStats: Row, batch and throughput counters for the run
+        """
+        return await self._run(ingest_records, self.storage, records, batch_size=batch_size, log_every=0,
+                               duplicate_filter=duplicate_filter, track_engagement=track_engagement)
+
+    async def get_all_searches(self):
+        """
+        Get all saved searches, see DatabaseStorage.get_all_searches
+
+        Returns:
+            list[SearchView]: The searches
+        """
+        return await self._run(self.storage.get_all_searches)
+
+    async def get_search(self, search_id: int):
+        """
+        Get a saved search, see DatabaseStorage.get_search
+
+        Returns:
+            SearchView: The search, None if it does not exist
+        """
+        return await self._run(self.storage.get_search, search_id)
+
+    async def run_search(self, search, full_rebuild=False, notifier=None, in_database=False):
+        """
+        Evaluate a saved search and store its matches, see modules.search_runner.run_search
+
+        Returns:
+            int: The number of matches written
+        """
+        return await self._run(run_search, self.storage, search, full_rebuild=full_rebuild, notifier=notifier,
+                               in_database=in_database)
+
+    async def run_all_searches(self, searches=None, full_rebuild=False, notifier=None, in_database=False):
+        """
+        Evaluate many saved searches in one pass, see modules.search_runner.run_all_searches
+
+        Returns:
+            dict: The number of matches written, keyed by search ID
+        """
+        return await self._run(run_all_searches, self.storage, searches=searches, full_rebuild=full_rebuild,
+                               notifier=notifier, in_database=in_database)
+
+    async def get_posts_page(self, cursor=None, per_page=10):
+        """
+        Get a page of posts with keyset pagination, see DatabaseStorage.get_posts_page
+
+        Returns:
+            tuple: (posts, next_cursor, prev_cursor)
+        """
+        return await self._run(self.storage.get_posts_page, cursor=cursor, per_page=per_page)
+
+    async def get_matches_page(self, search_id: int, cursor=None, per_page=10, sort=SORT_RECENT):
+        """
+        Get a page of the matches of a search, see DatabaseStorage.get_matches_page
+
+        Returns:
+            tuple: (matches, next_cursor, prev_cursor)
+        """
+        return await self._run(self.storage.get_matches_page, search_id, cursor=cursor, per_page=per_page,
+                               sort=sort)
+
+    async def count_posts(self):
+        """
+        Get the total number of posts, see DatabaseStorage.count_posts
+
+        Returns:
+            int: The number of posts
+        """
+        return await self._run(self.storage.count_posts)
+
+    async def count_matches(self, search_id: int):
+        """
+        Get the number of matches of a search, see DatabaseStorage.count_matches
+
+        Returns:
+            int: The number of matches
+        """
+        return await self._run(self.storage.count_matches, search_id)
@@ -0,0 +1,313 @@
+import io
+from datetime import date, datetime
+
+from sqlalchemy import Engine, or_, select, table, column, literal, literal_column, text, insert, func, exists
+from sqlalchemy.orm import aliased
+
+from database.Models import Post, Search, SearchTerm
+from database.database import has_post_search_index, POST_SEARCH_INDEX
+
+# Keywords shorter than this are not indexed by the trigram tokenizer and fall back to a scan
+FTS_MIN_KEYWORD_LENGTH = 3
+
+# Bulk writes of at least this many rows are sent with COPY on PostgreSQL, smaller ones with executemany
+COPY_MIN_ROWS = 1000
+
+# Rows serialized per COPY chunk
+COPY_CHUNK_SIZE = 10000
+
+
+class StorageBackend:
+    """
+    The backend-specific parts of DatabaseStorage: keyword search, bulk inserts and streaming reads
+
+    This base class only uses portable SQL (ILIKE scans, executemany inserts, yield_per
+    reads) and serves any backend SQLAlchemy supports. Subclasses override the paths their
+    database can do better; backend_for picks the subclass from the engine's connection URL.
+    """
+    name = 'generic'
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        # Whether keyword searches are served by an index over posts.content
+        self.has_search_index = has_post_search_index(engine)
+
+    def upsert(self, target):
+        """
+        Get an insert() construct for a table supporting ON CONFLICT clauses
+
+        Args:
+            target (Table): The table, or a mapped class
+
+        Returns:
+            Insert: The insert construct, None if the backend has no ON CONFLICT support
+        """
+        return None
+
+    @property
+    def supports_upsert(self) -> bool:
+        return self.upsert(Post) is not None
+
+    def keyword_filter(self, keywords: list[str], use_index=True):
+        """
+        Build the condition of posts whose content contains any of the keywords, ignoring case
+
+        Args:
+            keywords (list[str]): The keywords, stripped and non-empty
+            use_index (bool): If False, scan the content even when an index is available
+
+        Returns:
+            ColumnElement: A condition over posts
+        """
+        # ilike for case-insensitive search
+        return or_(*(Post.content.ilike(f"%{keyword}%") for keyword in keywords))
+
+    def search_terms_filter(self, search_id: int):
+        """
+        Build the condition of posts containing any of the stored search_terms of a search
+
+        Args:
+            search_id (int): The ID of the search
+
+        Returns:
+            ColumnElement: A condition over posts, correlated to search_terms
+        """
+        return exists().where(SearchTerm.search_id == search_id, Post.content.icontains(SearchTerm.term))
+
+    def bulk_insert(self, session, target, rows: list[dict], conflict_columns=None, update_columns=(),
+                    batch_size=None):
+        """
+        Insert many rows in the caller's transaction
+
+        Args:
+            session (Session): The session to write with
+            target (Table): The table to insert into
+            rows (list[dict]): The rows, all with the same keys and without duplicate conflict keys
+            conflict_columns (list[str], optional): Columns of a unique index; rows conflicting on
+                them are skipped, or updated when update_columns is given. Backends without
+                ON CONFLICT support insert them anyway, so the unique index raises.
+            update_columns (Iterable[str]): Columns overwritten from the new row on a conflict
+            batch_size (int, optional): Rows sent per executemany batch, all at once by default
+        """
+        if not rows:
+            return
+        statement = self._insert_statement(target, conflict_columns, update_columns)
+        batch_size = batch_size or len(rows)
+        for start in range(0, len(rows), batch_size):
+            session.execute(statement, rows[start:start + batch_size])
+
+    def _insert_statement(self, target, conflict_columns=None, update_columns=()):
+        statement = self.upsert(target) if conflict_columns else None
+        if statement is None:
+            return insert(target)
+        if update_columns:
+            return statement.on_conflict_do_update(
+                index_elements=conflict_columns,
+                set_={name: statement.excluded[name] for name in update_columns})
+        return statement.on_conflict_do_nothing(index_elements=conflict_columns)
+
+    def lock_matches(self, session, search_id: int):
+        """
+        Make the session's transaction the only one writing the matches of a search until it ends
+
+        Must come first in the transaction, so that everything it reads afterwards, e.g. the
+        match ID bound statistics are rolled up from, includes the commits of earlier writers.
+
+        Args:
+            session (Session): The session about to write the matches
+            search_id (int): The ID of the search
+        """
+        session.query(Search.id).filter(Search.id == search_id).with_for_update().scalar()
+
+    def committed_max_id(self, session, column) -> int:
+        """
+        Get the highest value of an ID column that no row added later can go below
+
+        Used as the watermark of search runs, so it must not pass an ID that another
+        transaction has drawn but not committed yet.
+
+        Args:
+            session (Session): The session to read in
+            column (Column): The autoincrementing primary key, e.g. Post.id
+
+        Returns:
+            int: The highest committed ID, or 0 if the table is empty
+        """
+        return session.query(func.max(column)).scalar() or 0
+
+    def stream(self, query, batch_size: int):
+        """
+        Make a query fetch its rows batch_size at a time instead of all at once
+
+        Args:
+            query (Query): The ORM query
+            batch_size (int): The number of rows fetched per round trip
+
+        Returns:
+            Query: The query, to iterate over
+        """
+        return query.yield_per(batch_size)
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    SQLite: keyword searches go through the FTS5 trigram index over posts.content when it exists
+    """
+    name = 'sqlite'
+
+    def upsert(self, target):
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(target)
+
+    def lock_matches(self, session, search_id: int):
+        # SQLite has no row locks, and its driver only opens a transaction at the first write, after the
+        # reads; BEGIN IMMEDIATE opens it with the database write lock held
+        session.execute(text('BEGIN IMMEDIATE'))
+
+    def keyword_filter(self, keywords: list[str], use_index=True):
+        if not (use_index and self.has_search_index):
+            return super().keyword_filter(keywords)
+        indexed = [k for k in keywords if len(k) >= FTS_MIN_KEYWORD_LENGTH]
+        scanned = [k for k in keywords if len(k) < FTS_MIN_KEYWORD_LENGTH]
+        filters = [Post.id.in_(self.fts_post_ids(indexed))] if indexed else []
+        if scanned:
+            filters.append(super().keyword_filter(scanned))
+        return or_(*filters)
+
+    @staticmethod
+    def fts_post_ids(keywords: list[str]):
+        """
+        Build a subquery selecting the IDs of posts whose content matches any keyword in the FTS index
+
+        Args:
+            keywords (list[str]): Keywords of at least FTS_MIN_KEYWORD_LENGTH characters
+
+        Returns:
+            Select: A SELECT of matching post IDs, usable with in_()
+        """
+        # Each keyword is a quoted phrase so punctuation and FTS operators are taken literally
+        match_query = ' OR '.join('"{}"'.format(keyword.replace('"', '""')) for keyword in keywords)
+        return (select(literal_column('rowid'))
+                .select_from(table(POST_SEARCH_INDEX))
+                .where(text(f"{POST_SEARCH_INDEX} MATCH :match_query").bindparams(match_query=match_query)))
+
+    def search_terms_filter(self, search_id: int):
+        if not self.has_search_index:
+            return super().search_terms_filter(search_id)
+        # Each term is matched as a quoted phrase so punctuation and FTS operators are taken literally
+        phrase = literal('"') + func.replace(SearchTerm.term, '"', '""') + literal('"')
+        indexed = (select(literal_column(f'{POST_SEARCH_INDEX}.rowid'))
+                   .select_from(SearchTerm)
+                   .join(table(POST_SEARCH_INDEX), literal_column(POST_SEARCH_INDEX).op('MATCH')(phrase))
+                   .where(SearchTerm.search_id == search_id,
+                          func.length(SearchTerm.term) >= FTS_MIN_KEYWORD_LENGTH))
+        return or_(Post.id.in_(indexed),
+                   exists().where(SearchTerm.search_id == search_id, Post.content.icontains(SearchTerm.term),
+                                  func.length(SearchTerm.term) < FTS_MIN_KEYWORD_LENGTH))
+
+
+def _copy_value(value):
+    # CSV field for COPY: an unquoted empty field is NULL, a quoted one an empty string
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class PostgreSQLBackend(StorageBackend):
+    """
+    PostgreSQL: ILIKE keyword searches are served by the pg_trgm GIN index, large bulk
+    writes are loaded with COPY and streaming reads use server-side cursors
+    """
+    name = 'postgresql'
+
+    def upsert(self, target):
+        from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+        return postgresql_insert(target)
+
+    def search_terms_filter(self, search_id: int):
+        # Joining the terms to the posts lets the planner probe the trigram index once per term,
+        # where a correlated EXISTS would test every post against every term
+        matched = aliased(Post)
+        pattern = literal('%') + SearchTerm.term + literal('%')
+        return Post.id.in_(select(matched.id)
+                           .select_from(SearchTerm)
+                           .join(matched, matched.content.ilike(pattern))
+                           .where(SearchTerm.search_id == search_id))
+
+    def bulk_insert(self, session, target, rows: list[dict], conflict_columns=None, update_columns=(),
+                    batch_size=None):
+        if len(rows) < COPY_MIN_ROWS or self.engine.dialect.driver not in ('psycopg2', 'psycopg'):
+            return super().bulk_insert(session, target, rows, conflict_columns, update_columns, batch_size)
+        target = getattr(target, '__table__', target)
+        columns = list(rows[0])
+        if not conflict_columns:
+            self._copy(session, target.name, columns, rows)
+            return
+        # COPY cannot resolve conflicts, so the rows go through a staging table and INSERT ... SELECT
+        staging = f'_staging_{target.name}'
+        session.execute(text(f'DROP TABLE IF EXISTS {staging}'))
+        session.execute(text(f'CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS '
+                             f'SELECT {", ".join(columns)} FROM {target.name} WITH NO DATA'))
+        self._copy(session, staging, columns, rows)
+        source = select(*table(staging, *(column(name) for name in columns)).columns)
+        statement = self._insert_statement(target, conflict_columns, update_columns)
+        session.execute(statement.from_select(columns, source))
+
+    def _copy(self, session, table_name: str, columns: list[str], rows: list[dict]):
+        """
+        Load rows into a table with COPY ... FROM STDIN, on the session's connection and transaction
+        """
+        statement = f'COPY {table_name} ({", ".join(columns)}) FROM STDIN'
+        cursor = session.connection().connection.cursor()
+        try:
+            if self.engine.dialect.driver == 'psycopg':
+                with cursor.copy(statement) as copy:
+                    for row in rows:
+                        copy.write_row([row[name] for name in columns])
+                return
+            for start in range(0, len(rows), COPY_CHUNK_SIZE):
+                buffer = io.StringIO()
+                for row in rows[start:start + COPY_CHUNK_SIZE]:
+                    buffer.write(','.join(_copy_value(row[name]) for name in columns))
+                    buffer.write('\n')
+                buffer.seek(0)
+                cursor.copy_expert(f'{statement} WITH (FORMAT csv)', buffer)
+        finally:
+            cursor.close()
+
+    def committed_max_id(self, session, column) -> int:
+        # Sequence values are drawn before commit, so a transaction still inserting can commit an ID below
+        # the highest visible one. SHARE mode waits for every transaction holding the ROW EXCLUSIVE lock
+        # that INSERT and COPY take, and holds off new ones until the read's transaction ends
+        session.execute(text(f'LOCK TABLE {column.table.name} IN SHARE MODE'))
+        return super().committed_max_id(session, column)
+
+    def stream(self, query, batch_size: int):
+        # A named (server-side) cursor: the database keeps the result set and sends batch_size rows per fetch
+        return query.execution_options(stream_results=True, max_row_buffer=batch_size).yield_per(batch_size)
+
+
+# Backend class for each SQLAlchemy dialect name, i.e. the scheme of the connection URL
+BACKENDS = {
+    SQLiteBackend.name: SQLiteBackend,
+    PostgreSQLBackend.name: PostgreSQLBackend,
+}
+
+
+def backend_for(engine: Engine) -> StorageBackend:
+    """
+    Create the storage backend matching an engine's database
+
+    Args:
+        engine (Engine): The engine, whose connection URL selects the backend
+
+    Returns:
+        StorageBackend: The backend, the generic one for databases without a dedicated class
+    """
+    return BACKENDS.get(engine.dialect.name, StorageBackend)(engine)
@@ -0,0 +1,231 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from modules.storage import DatabaseStorage, SORT_RECENT
+
+# Default number of entries kept by LRUCache
+DEFAULT_MAX_ENTRIES = 1024
+
+# Default seconds an entry stays valid
+DEFAULT_TTL = 300
+
+# Seconds the match version read from the database is reused, so that a page view reads it once
+MATCH_VERSION_TTL = 1
+
+_MISSING = object()
+
+
+class CacheBackend:
+    """
+    Interface of the key/value stores CachedStorage can use
+
+    Keys are hashable tuples and values arbitrary Python objects. A backend for a shared
+    store (e.g. Redis) only needs to implement these three methods.
+    """
+
+    def get(self, key: Hashable, default=None) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, key: Hashable):
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """
+    Thread-safe in-process cache with least-recently-used eviction and per-entry TTL
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        """
+        Args:
+            max_entries (int): The maximum number of entries kept before evicting the least recently used
+            ttl (float): Default seconds an entry stays valid, None for no expiry
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CachedStorage:
+    """
+    Read-through cache around DatabaseStorage
+
+    Search definitions, match pages and counts are served from the cache backend and
+    invalidated by the storage methods that change them. Entries are grouped into
+    namespaces (all searches, one search, the matches of one search, match statistics, posts) whose
+    generation number is part of every key: invalidating a namespace bumps its
+    generation, which makes all its entries unreachable without enumerating them.
+    Generations are tracked per CachedStorage instance, so invalidations are only seen
+    by caches in the same process. The match entries of a search are also keyed on its match
+    version read from the database, so matches written by other processes (the monitor, search
+    jobs) are served at most MATCH_VERSION_TTL seconds late. Other entries, and the engagement
+    counts shown on match pages when posts are updated by another process, can be stale for up
+    to the backend's TTL. Methods that are not cached are delegated to the wrapped storage unchanged.
+    """
+
+    def __init__(self, storage: DatabaseStorage, backend: CacheBackend = None):
+        """
+        Args:
+            storage (DatabaseStorage): The storage to wrap
+            backend (CacheBackend): Where cached values are kept. Defaults to an LRUCache.
+        """
+        self.storage = storage
+        self.backend = backend if backend is not None else LRUCache()
+        self.hits = 0
+        self.misses = 0
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+
+    def cache_stats(self):
+        """
+        Get the cache hit/miss counters
+
+        Returns:
+            dict: hits, misses and hit_ratio
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_ratio': self.hits / total if total else 0.0}
+
+    def _invalidate(self, *namespaces):
+        with self._lock:
+            for namespace in namespaces:
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+                if namespace[0] == 'matches':
+                    self.backend.delete(('match_version', namespace[1]))
+
+    def _match_version(self, search_id: int):
+        key = ('match_version', search_id)
+        version = self.backend.get(key, _MISSING)
+        if version is _MISSING:
+            version = self.storage.get_match_version(search_id)
+            self.backend.set(key, version, ttl=MATCH_VERSION_TTL)
+        return version
+
+    def _cached_matches(self, search_id: int, key, load):
+        # Match pages embed post engagement, so they also follow the posts generation
+        version = (self._match_version(search_id), self._generations.get(('posts',), 0))
+        return self._cached(('matches', search_id), version + key, load)
+
+    def _cached(self, namespace, key, load):
+        full_key = namespace + (self._generations.get(namespace, 0),) + key
+        value = self.backend.get(full_key, _MISSING)
+        with self._lock:
+            if value is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is _MISSING:
+            value = load()
+            self.backend.set(full_key, value)
+        return value
+
+    # Cached reads
+
+    def get_all_searches(self):
+        return self._cached(('searches',), (), self.storage.get_all_searches)
+
+    def get_search(self, search_id: int):
+        search_id = int(search_id)
+        return self._cached(('search', search_id), (), lambda: self.storage.get_search(search_id))
+
+    def get_matches_page(self, search_id: int, cursor=None, per_page=10, sort=SORT_RECENT):
+        search_id = int(search_id)
+        return self._cached_matches(search_id, ('page', cursor, per_page, sort),
+                                    lambda: self.storage.get_matches_page(search_id, cursor=cursor, per_page=per_page,
+                                                                          sort=sort))
+
+    def get_matches_paginated(self, search_id: int, page=1, per_page=10):
+        search_id = int(search_id)
+        return self._cached_matches(search_id, ('offset', page, per_page),
+                                    lambda: self.storage.get_matches_paginated(search_id, page=page,
+                                                                               per_page=per_page))
+
+    def count_matches(self, search_id: int):
+        # The match version holds the count
+        version = self._match_version(int(search_id))
+        return (version[1] or 0) if version is not None else 0
+
+    def count_posts(self):
+        return self._cached(('posts',), ('count',), self.storage.count_posts)
+
+    def get_search_stats(self):
+        return self._cached(('stats',), (), self.storage.get_search_stats)
+
+    def get_search_activity(self, search_id: int, *args, **kwargs):
+        search_id = int(search_id)
+        return self._cached_matches(search_id, ('activity', args, tuple(sorted(kwargs.items()))),
+                                    lambda: self.storage.get_search_activity(search_id, *args, **kwargs))
+
+    # Writes with invalidation
+
+    def save_search(self, search_data):
+        search_id = self.storage.save_search(search_data)
+        self._invalidate(('searches',), ('search', int(search_id)))
+        return search_id
+
+    def delete_search(self, search_id: int):
+        deleted = self.storage.delete_search(search_id)
+        self._invalidate(('searches',), ('search', int(search_id)), ('matches', int(search_id)), ('stats',))
+        return deleted
+
+    def save_match(self, match_data):
+        match_id = self.storage.save_match(match_data)
+        self._invalidate(('matches', int(match_data['search_id'])), ('stats',))
+        return match_id
+
+    def save_matches(self, search_id: int, matches, *args, **kwargs):
+        count = self.storage.save_matches(search_id, matches, *args, **kwargs)
+        self._invalidate(('matches', int(search_id)), ('stats',))
+        return count
+
+    def insert_search_matches(self, search_id: int, *args, **kwargs):
+        count = self.storage.insert_search_matches(search_id, *args, **kwargs)
+        self._invalidate(('matches', int(search_id)), ('stats',))
+        return count
+
+    def delete_matches(self, search_id: int):
+        count = self.storage.delete_matches(search_id)
+        self._invalidate(('matches', int(search_id)), ('stats',))
+        return count
+
+    def upsert_posts(self, posts):
+        count = self.storage.upsert_posts(posts)
+        self._invalidate(('posts',))
+        return count
@@ -0,0 +1,197 @@
+import hashlib
+import re
+from typing import Dict
+
+from modules.storage import DatabaseStorage
+
+# Duplicate handling modes
+MARK = 'mark'  # Store near-duplicates, linked to their canonical post
+SKIP = 'skip'  # Do not store near-duplicates at all
+
+# Maximum number of differing SimHash bits for two posts to count as near-duplicates.
+# With four 16-bit bands, pairs within 3 bits always share at least one band.
+DEFAULT_MAX_DISTANCE = 3
+
+# Number of consecutive words hashed together
+SHINGLE_SIZE = 3
+
+_BANDS = 4
+_BAND_BITS = 16
+_WORD_PATTERN = re.compile(r'\w+')
+
+
+def simhash(text: str) -> int:
+    """
+    Compute the 64-bit SimHash of a text over its word shingles
+
+    Texts differing by a few words get hashes differing by a few bits, so the Hamming
+    distance between two hashes estimates how different the texts are.
+
+    Args:
+        text (str): The text to hash
+
+    Returns:
+        int: The unsigned 64-bit SimHash
+    """
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) > SHINGLE_SIZE:
+        shingles = {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    else:
+        shingles = {' '.join(words)}
+    bits = [format(int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'big'), '064b')
+            for shingle in shingles]
+    threshold = len(bits) / 2
+    # zip(*bits) yields one column of bits per position, most significant first
+    return int(''.join('1' if column.count('1') > threshold else '0' for column in zip(*bits)), 2)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def bands(value: int) -> tuple:
+    """
+    Split an unsigned 64-bit SimHash into its four 16-bit bands
+    """
+    mask = (1 << _BAND_BITS) - 1
+    return tuple((value >> (i * _BAND_BITS)) & mask for i in range(_BANDS))
+
+
+def to_signed(value: int) -> int:
+    # SQL BIGINT columns are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class DuplicateFilter:
+    """
+    Near-duplicate detection for ingestion, backed by the post_signatures table
+
+    Every ingested post gets a SimHash signature. A post whose signature is within
+    max_distance bits of an already stored post (or of an earlier post of the same batch)
+    is a near-duplicate: in MARK mode it is stored with canonical_post_id pointing to the
+    original, in SKIP mode it is not stored at all. Candidates are found with one query
+    per batch on the indexed signature bands, and re-scrapes of the same post_url are
+    never considered duplicates of themselves.
+    """
+
+    def __init__(self, storage: DatabaseStorage, mode=MARK, max_distance=DEFAULT_MAX_DISTANCE):
+        """
+        Args:
+            storage (DatabaseStorage): The storage holding posts and signatures
+            mode (str): MARK to store and link near-duplicates, SKIP to drop them
+            max_distance (int): Maximum number of differing bits between near-duplicates
+        """
+        if mode not in (MARK, SKIP):
+            raise ValueError(f"Unknown duplicate mode '{mode}'")
+        self.storage = storage
+        self.mode = mode
+        self.max_distance = max_distance
+
+    def check(self, posts: list[Dict]):
+        """
+        Find the near-duplicates in a batch of posts about to be written
+
+        Args:
+            posts (list): Dictionaries with the Post column values
+
+        Returns:
+            tuple: (posts, signatures, duplicates) - The posts to write, the pending signatures
+            to pass to record() once they are written, and the number of near-duplicates found
+        """
+        hashes = [simhash(post['content']) for post in posts]
+        index = [dict() for _ in range(_BANDS)]  # band value -> [(post_id, post_url, simhash, canonical)]
+
+        def add(entry, value):
+            for i, band in enumerate(bands(value)):
+                index[i].setdefault(band, []).append(entry)
+
+        # IDs of the posts already stored, so re-scrapes are not matched against the posts linked to them
+        stored_ids = self.storage.get_post_ids_by_urls([post['post_url'] for post in posts])
+        for candidate in self.storage.find_signature_candidates([bands(value) for value in hashes]):
+            value = to_unsigned(candidate.simhash)
+            add((candidate.post_id, candidate.post_url, value, candidate.canonical_post_id), value)
+
+        kept, signatures, duplicates = [], [], 0
+        for post, value in zip(posts, hashes):
+            canonical = self._nearest(index, post['post_url'], stored_ids.get(post['post_url']), value)
+            if canonical is not None:
+                duplicates += 1
+                if self.mode == SKIP:
+                    continue
+            kept.append(post)
+            signatures.append({'post_url': post['post_url'], 'simhash': value, 'canonical': canonical})
+            # Later posts of the batch resolve to this post's canonical, or to this post by URL
+            add((None, post['post_url'], value, canonical), value)
+        return kept, signatures, duplicates
+
+    def _nearest(self, index, post_url, stored_id, value):
+        best, best_distance = None, self.max_distance + 1
+        for i, band in enumerate(bands(value)):
+            for post_id, url, other, canonical in index[i].get(band, ()):
+                if url == post_url or (stored_id is not None and canonical == stored_id):
+                    continue
+                distance = hamming_distance(value, other)
+                if distance < best_distance:
+                    best_distance = distance
+                    # The canonical of a stored post is an ID, of a post in this batch a ('url', ...) reference
+                    best = canonical if canonical is not None else (post_id if post_id is not None else ('url', url))
+        return best
+
+    def record(self, signatures: list[Dict]):
+        """
+        Persist the signatures returned by check() once their posts have been written
+
+        Args:
+            signatures (list): The pending signatures from check()
+
+        Returns:
+            int: The number of signatures written
+        """
+        urls = {signature['post_url'] for signature in signatures}
+        urls |= {s['canonical'][1] for s in signatures if isinstance(s['canonical'], tuple)}
+        post_ids = self.storage.get_post_ids_by_urls(list(urls))
+
+        rows = {}
+        for signature in signatures:
+            post_id = post_ids.get(signature['post_url'])
+            if post_id is None:
+                continue
+            canonical = signature['canonical']
+            if isinstance(canonical, tuple):
+                canonical = post_ids.get(canonical[1])
+            value = signature['simhash']
+            # Keyed by post ID: a URL repeated within the batch keeps its last signature
+            rows[post_id] = {
+                'post_id': post_id,
+                'simhash': to_signed(value),
+                **{f'band{i}': band for i, band in enumerate(bands(value))},
+                'canonical_post_id': canonical if canonical != post_id else None,
+            }
+        return self.storage.save_signatures(list(rows.values()))
+
+    def backfill(self, batch_size=1000):
+        """
+        Compute signatures for stored posts that do not have one yet, marking near-duplicates
+
+        Args:
+            batch_size (int): The number of posts processed per transaction
+
+        Returns:
+            int: The number of signatures written
+        """
+        mode, self.mode = self.mode, MARK
+        written = 0
+        try:
+            while True:
+                rows = self.storage.get_posts_without_signature(limit=batch_size)
+                if not rows:
+                    return written
+                posts = [{'post_url': row.post_url, 'content': row.content} for row in rows]
+                _, signatures, _ = self.check(posts)
+                written += self.record(signatures)
+        finally:
+            self.mode = mode
@@ -0,0 +1,238 @@
+import json
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional, TextIO
+
+from modules.storage import DatabaseStorage
+
+logger = logging.getLogger(__name__)
+
+# Number of posts written per transaction
+DEFAULT_BATCH_SIZE = 1000
+
+# Number of characters read from the input at a time
+READ_CHUNK_SIZE = 1 << 16
+
+# Longest record, in characters, read before a value that still does not decode is reported as invalid
+MAX_RECORD_SIZE = 16 << 20
+
+# Characters allowed between records: whitespace, JSONL newlines and JSON array punctuation
+_SEPARATORS = ' \t\r\n,[]'
+
+# JSON literals a chunk boundary can cut in two
+_LITERALS = ('true', 'false', 'null', 'NaN', 'Infinity', '-Infinity')
+
+
+@dataclass
+class IngestionStats:
+    """
+    Counters reported by an ingestion run
+    """
+    rows: int = 0
+    skipped: int = 0
+    duplicates: int = 0
+    snapshots: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"{self.rows} posts in {self.batches} batches, {self.skipped} skipped, "
+                f"{self.duplicates} near-duplicates, {self.snapshots} engagement snapshots, "
+                f"{self.seconds:.1f}s ({self.rows_per_second:.0f} rows/sec)")
+
+
+def iter_json_records(stream: TextIO, chunk_size=READ_CHUNK_SIZE) -> Iterator[Dict]:
+    """
+    Incrementally decode JSON objects from a text stream
+
+    Accepts a top-level JSON array of objects as well as JSON Lines (or any sequence of
+    concatenated objects). Only one chunk plus the object being decoded is held in
+    memory, so arbitrarily large exports are processed in constant memory.
+
+    Args:
+        stream (TextIO): The text stream to read from
+        chunk_size (int): The number of characters to read at a time
+
+    Yields:
+        dict: The decoded objects, in input order
+
+    Raises:
+        json.JSONDecodeError: At the first malformed value, without reading further, or once a
+            record grows beyond MAX_RECORD_SIZE characters
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in _SEPARATORS:
+            position += 1
+
+        if position < len(buffer):
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if eof or not _truncated(e, buffer):
+                    raise
+                if len(buffer) - position > MAX_RECORD_SIZE:
+                    raise json.JSONDecodeError(f"Record longer than {MAX_RECORD_SIZE} characters", buffer,
+                                               position) from e
+            else:
+                # A number or literal cut at the chunk boundary can decode early, so only
+                # trust a value that is followed by more input
+                if end < len(buffer) or eof:
+                    yield record
+                    position = end
+                    continue
+
+        if eof:
+            return
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def _truncated(error: json.JSONDecodeError, buffer: str) -> bool:
+    """
+    Whether a decode error may be cured by more input, i.e. the value was cut at the end of the buffer
+
+    Most errors are reported at the end of a cut value, but strings, \\u escapes and literals
+    are reported where they start.
+    """
+    rest = buffer[error.pos:]
+    if len(rest) <= 1 or error.msg.startswith('Unterminated string'):
+        return True
+    if error.msg.startswith('Invalid \\uXXXX escape'):
+        # A high surrogate is reported at its own escape while its low surrogate is cut
+        return len(rest) < len('uXXXX\\uXXXX')
+    if error.msg == 'Expecting value':
+        return any(literal.startswith(rest) for literal in _LITERALS)
+    return False
+
+
+def _parse_timestamp(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def post_from_record(record: Dict) -> Optional[Dict]:
+    """
+    Map a scraped post record onto Post column values
+
+    Both the scraper export field names (url, user_id, post_text, date_posted, ...)
+    and the Post column names are accepted.
+
+    Args:
+        record (dict): The scraped record
+
+    Returns:
+        dict: The Post column values, or None if the record lacks a URL, content or date
+    """
+    post_url = record.get('post_url') or record.get('url')
+    content = record.get('content') or record.get('post_text')
+    timestamp = record.get('timestamp') or record.get('date_posted')
+    if not post_url or content is None or not timestamp:
+        return None
+    try:
+        timestamp = _parse_timestamp(timestamp)
+    except (TypeError, ValueError):
+        return None
+
+    return {
+        'post_url': post_url,
+        'user_name': record.get('user_name') or record.get('user_id'),
+        'user_url': record.get('user_url') or record.get('use_url'),
+        'content': content,
+        'timestamp': timestamp,
+        'likes': record.get('likes', record.get('num_likes')) or 0,
+        'comments': record.get('comments', record.get('num_comments')) or 0,
+        'shares': record.get('shares', record.get('num_shares')) or 0,
+    }
+
+
+def ingest_records(storage: DatabaseStorage, records: Iterable[Dict], batch_size=DEFAULT_BATCH_SIZE,
+                   log_every=100, duplicate_filter=None, track_engagement=True) -> IngestionStats:
+    """
+    Upsert scraped post records into the database in batches
+
+    Each batch is written in a single transaction via DatabaseStorage.upsert_posts,
+    so a post_url that already exists updates its engagement counters instead of
+    aborting the run. Records that cannot be mapped to a post are counted as skipped.
+    With a duplicate filter, each batch is checked for near-duplicates before it is
+    written, and the signatures of the written posts are stored after it. With
+    track_engagement, the engagement counters of every written post are also appended
+    to its snapshot series, so re-scraping a post records how fast it is growing.
+
+    Args:
+        storage (DatabaseStorage): The storage to write to
+        records (Iterable[dict]): The scraped records, e.g. from iter_json_records
+        batch_size (int): The number of posts written per transaction
+        log_every (int): Log progress every this many batches (0 disables)
+        duplicate_filter (DuplicateFilter): Optional near-duplicate filter, see modules/dedup.py
+        track_engagement (bool): Append an engagement snapshot of every written post
+
+    Returns:
+        IngestionStats: Row, batch and throughput counters for the run
+    """
+    stats = IngestionStats()
+    started = time.perf_counter()
+    batch = []
+
+    def flush():
+        posts = batch
+        if duplicate_filter is not None:
+            posts, signatures, duplicates = duplicate_filter.check(batch)
+            stats.duplicates += duplicates
+        stats.rows += storage.upsert_posts(posts)
+        if duplicate_filter is not None:
+            duplicate_filter.record(signatures)
+        if track_engagement:
+            stats.snapshots += storage.save_engagement_snapshots(posts)
+        stats.batches += 1
+        batch.clear()
+        if log_every and stats.batches % log_every == 0:
+            stats.seconds = time.perf_counter() - started
+            logger.info("Ingested %s", stats)
+
+    for record in records:
+        post = post_from_record(record)
+        if post is None:
+            stats.skipped += 1
+            continue
+        batch.append(post)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def ingest_file(storage: DatabaseStorage, path: str, batch_size=DEFAULT_BATCH_SIZE, log_every=100,
+                duplicate_filter=None, track_engagement=True) -> IngestionStats:
+    """
+    Stream a JSON or JSON Lines export file into the database
+
+    Args:
+        storage (DatabaseStorage): The storage to write to
+        path (str): Path to the export file
+        batch_size (int): The number of posts written per transaction
+        log_every (int): Log progress every this many batches (0 disables)
+        duplicate_filter (DuplicateFilter): Optional near-duplicate filter, see modules/dedup.py
+        track_engagement (bool): Append an engagement snapshot of every written post
+
+    Returns:
+        IngestionStats: Row, batch and throughput counters for the run
+    """
+    with open(path, encoding='utf-8') as stream:
+        return ingest_records(storage, iter_json_records(stream), batch_size=batch_size, log_every=log_every,
+                              duplicate_filter=duplicate_filter, track_engagement=track_engagement)
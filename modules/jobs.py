@@ -0,0 +1,172 @@
+import json
+import logging
+import threading
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from modules.search_runner import run_search, run_all_searches
+from modules.storage import DatabaseStorage
+
+logger = logging.getLogger(__name__)
+
+# Default number of searches run in parallel
+DEFAULT_MAX_WORKERS = 4
+
+# Job kinds
+SEARCH_JOB = 'search'
+ALL_SEARCHES_JOB = 'all_searches'
+
+# Job statuses
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+# Smallest progress change persisted to the jobs table, to avoid a write per batch
+PROGRESS_STEP = 0.05
+
+
+class JobRunner:
+    """
+    Runs search jobs on a thread pool, outside of the HTTP request that created them
+
+    Each job is persisted in the jobs table when it is enqueued, so its status and
+    progress can be polled by ID from any request. Different searches run in parallel;
+    runs touching the same search are serialized, since they write the same matches.
+    """
+
+    def __init__(self, storage: DatabaseStorage, max_workers=DEFAULT_MAX_WORKERS, notifier=None):
+        """
+        Args:
+            storage (DatabaseStorage): The storage the jobs read from and write to
+            max_workers (int): The maximum number of jobs running at the same time
+            notifier (NotificationDispatcher): Optional dispatcher told about new matches
+        """
+        self.storage = storage
+        self.notifier = notifier
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._search_locks = {}
+        self._locks_lock = threading.Lock()
+
+    def submit_search(self, search_id: int, full_rebuild=False):
+        """
+        Enqueue a run of one saved search
+
+        Args:
+            search_id (int): The ID of the search
+            full_rebuild (bool): Whether to ignore the search watermark
+
+        Returns:
+            int: The ID of the job
+        """
+        job_id = self.storage.create_job(SEARCH_JOB, search_id=search_id, full_rebuild=full_rebuild)
+        self.executor.submit(self._run, job_id)
+        return job_id
+
+    def submit_all_searches(self, full_rebuild=False):
+        """
+        Enqueue a single-pass run of all saved searches
+
+        Args:
+            full_rebuild (bool): Whether to ignore the search watermarks
+
+        Returns:
+            int: The ID of the job
+        """
+        job_id = self.storage.create_job(ALL_SEARCHES_JOB, full_rebuild=full_rebuild)
+        self.executor.submit(self._run, job_id)
+        return job_id
+
+    def recover(self):
+        """
+        Resume the jobs left behind by a previous process
+
+        Queued jobs are submitted again; jobs that were running when the process
+        stopped are marked as failed. Call it once, from the process serving the jobs
+        and before it takes requests: a process recovering while another one is running
+        jobs would mark that process's running jobs as failed.
+
+        Returns:
+            int: The number of jobs resubmitted
+        """
+        for job in self.storage.get_jobs(statuses=[RUNNING], limit=None):
+            self.storage.update_job(job.id, status=FAILED, result='Interrupted', finished_at=datetime.now())
+        queued = self.storage.get_jobs(statuses=[QUEUED], limit=None)
+        for job in reversed(queued):
+            self.executor.submit(self._run, job.id)
+        return len(queued)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+    def _search_lock(self, search_id):
+        with self._locks_lock:
+            return self._search_locks.setdefault(search_id, threading.Lock())
+
+    def _run(self, job_id: int):
+        # Another process may have picked up the same queued job, e.g. during recovery
+        if not self.storage.claim_job(job_id):
+            return
+        job = self.storage.get_job(job_id)
+
+        reported = [0.0]
+
+        def progress(fraction):
+            if fraction - reported[0] >= PROGRESS_STEP:
+                reported[0] = fraction
+                self.storage.update_job(job_id, progress=round(fraction, 3))
+
+        try:
+            if job.kind == SEARCH_JOB:
+                search = self.storage.get_search(job.search_id)
+                if search is None:
+                    raise LookupError(f"Search {job.search_id} not found")
+                with self._search_lock(search.id):
+                    count = run_search(self.storage, search, full_rebuild=job.full_rebuild, progress=progress,
+                                       notifier=self.notifier)
+                result = {'matches': count}
+            elif job.kind == ALL_SEARCHES_JOB:
+                searches = self.storage.get_all_searches()
+                with ExitStack() as stack:
+                    # Locks are always taken in search ID order, so this cannot deadlock with other jobs
+                    for search in sorted(searches, key=lambda s: s.id):
+                        stack.enter_context(self._search_lock(search.id))
+                    counts = run_all_searches(self.storage, searches, full_rebuild=job.full_rebuild,
+                                              progress=progress, notifier=self.notifier)
+                result = {'searches': len(counts), 'matches': sum(counts.values())}
+            else:
+                raise ValueError(f"Unknown job kind '{job.kind}'")
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            self.storage.update_job(job_id, status=FAILED, result=str(e), finished_at=datetime.now())
+        else:
+            self.storage.update_job(job_id, status=SUCCEEDED, progress=1.0, result=json.dumps(result),
+                                    finished_at=datetime.now())
+
+
+def job_status(job):
+    """
+    Serialize a job for the status endpoint
+
+    Args:
+        job (Job): The job
+
+    Returns:
+        dict: The job fields, with the result decoded for succeeded jobs
+    """
+    result = job.result
+    if job.status == SUCCEEDED and result:
+        result = json.loads(result)
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'search_id': job.search_id,
+        'full_rebuild': job.full_rebuild,
+        'status': job.status,
+        'progress': job.progress,
+        'result': result,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
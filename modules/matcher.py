@@ -0,0 +1,142 @@
+from collections import deque
+from typing import Hashable, Iterable
+
+
+class AhoCorasick:
+    """
+    Multi-pattern substring matcher (Aho-Corasick automaton)
+
+    Every pattern is associated with one or more values; find() scans a text once and
+    returns the values of all patterns occurring in it. Matching is case-insensitive,
+    mirroring the ilike('%keyword%') semantics of DatabaseStorage.get_post_ids_by_keywords.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+        self._built = False
+
+    def add(self, pattern: str, value: Hashable):
+        """
+        Register a pattern and the value reported when it matches
+
+        Args:
+            pattern (str): The substring to look for
+            value (Hashable): The value reported by find() for this pattern
+        """
+        pattern = pattern.lower()
+        if not pattern:
+            return
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            node = next_node
+        self._output[node].add(value)
+        self._built = False
+
+    def build(self):
+        """
+        Compute the failure links; called automatically by find() when needed
+        """
+        queue = deque(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child] |= self._output[self._fail[child]]
+        self._built = True
+
+    def find(self, text: str) -> set:
+        """
+        Scan a text once and collect the values of every pattern it contains
+
+        Args:
+            text (str): The text to scan
+
+        Returns:
+            set: The values of all matching patterns
+        """
+        if not self._built:
+            self.build()
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        node = 0
+        for char in text.lower():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found |= output[node]
+        return found
+
+    def __len__(self):
+        return len(self._goto) - 1
+
+
+class MultiSearchMatcher:
+    """
+    Evaluates many saved searches against a post in a single pass
+
+    Keywords of all topic/job searches are compiled into one Aho-Corasick automaton and
+    usernames of all user searches into a hash map, so matching a post costs one scan of
+    its content plus one dictionary lookup, regardless of the number of searches.
+    """
+
+    def __init__(self):
+        self.keywords = AhoCorasick()
+        self.usernames = {}
+        self.search_ids = set()
+
+    def add_keywords(self, search_id: int, keywords: Iterable[str]):
+        """
+        Register the keywords of a topic/job search
+
+        Args:
+            search_id (int): The ID of the search
+            keywords (Iterable[str]): Keywords matched as case-insensitive substrings
+        """
+        for keyword in keywords:
+            self.keywords.add(keyword, search_id)
+        self.search_ids.add(search_id)
+
+    def add_usernames(self, search_id: int, usernames: Iterable[str]):
+        """
+        Register the usernames of a user search
+
+        Args:
+            search_id (int): The ID of the search
+            usernames (Iterable[str]): Exact user names to match
+        """
+        for username in usernames:
+            self.usernames.setdefault(username, set()).add(search_id)
+        self.search_ids.add(search_id)
+
+    def match(self, user_name, content) -> set:
+        """
+        Get the IDs of all registered searches matching a post
+
+        Args:
+            user_name (str): The post author, may be None
+            content (str): The post content, may be None
+
+        Returns:
+            set: The IDs of the matching searches
+        """
+        matched = set(self.usernames.get(user_name, ())) if user_name is not None else set()
+        if content and len(self.keywords):
+            matched |= self.keywords.find(content)
+        return matched
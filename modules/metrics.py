@@ -0,0 +1,284 @@
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Optional
+
+from flask import Flask, Response, g, request
+from sqlalchemy import event
+
+from modules.storage import DatabaseStorage
+
+slow_query_logger = logging.getLogger('modules.metrics.slow_queries')
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upper bounds of the per-request SQL statement count buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Longest statement text written to the slow query log
+SLOW_QUERY_MAX_LENGTH = 500
+
+# The current request's SQL counters, see instrument_app
+_request_stats = threading.local()
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonically increasing value, per label combination
+    """
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """
+    Distribution of observed values over fixed buckets, per label combination
+    """
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return series[-1] if series else 0
+
+    def sum(self, *label_values):
+        series = self._series.get(label_values)
+        return series[-2] if series else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    labels = _format_labels(self.labels + ('le',), label_values + (_format_value(bound),))
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labels + ('le',), label_values + ('+Inf',))
+                lines.append(f'{self.name}_bucket{labels} {series[-1]}')
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f'{self.name}_sum{labels} {_format_value(float(series[-2]))}')
+                lines.append(f'{self.name}_count{labels} {series[-1]}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The metrics recorded by the instrumentation, rendered in the Prometheus text format
+    """
+
+    def __init__(self):
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Time spent handling HTTP requests', ('method', 'route', 'status'))
+        self.request_queries = Histogram(
+            'http_request_sql_queries', 'SQL statements executed per HTTP request', ('method', 'route'),
+            buckets=QUERY_COUNT_BUCKETS)
+        self.request_query_duration = Histogram(
+            'http_request_sql_duration_seconds', 'Time spent in SQL statements per HTTP request', ('method', 'route'))
+        self.query_duration = Histogram(
+            'sql_query_duration_seconds', 'Time spent executing SQL statements', ('operation',))
+        self.slow_queries = Counter(
+            'sql_slow_queries_total', 'SQL statements slower than the slow query threshold', ('operation',))
+        self.storage_duration = Histogram(
+            'storage_method_duration_seconds', 'Time spent in DatabaseStorage methods', ('method',))
+        self.storage_errors = Counter(
+            'storage_method_errors_total', 'DatabaseStorage method calls that raised', ('method',))
+
+    def metrics(self):
+        return [self.request_duration, self.request_queries, self.request_query_duration, self.query_duration,
+                self.slow_queries, self.storage_duration, self.storage_errors]
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def _operation(statement: str) -> str:
+    # The first keyword (SELECT, INSERT, ...) keeps the label cardinality small
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else 'UNKNOWN'
+
+
+def instrument_engine(engine, registry: MetricsRegistry, slow_query_threshold: Optional[float] = None):
+    """
+    Record the duration of every SQL statement run on an engine
+
+    Statements run while a request is handled are also added to that request's counters.
+
+    Args:
+        engine (Engine): The SQLAlchemy engine
+        registry (MetricsRegistry): Where the timings are recorded
+        slow_query_threshold (float): Statements slower than this many seconds are logged
+            to the modules.metrics.slow_queries logger, None disables the log
+    """
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Kept on the statement's execution context, which is discarded with it if the statement fails
+        if context is not None:
+            context.query_started_at = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started_at = getattr(context, 'query_started_at', None)
+        if started_at is None:
+            return
+        elapsed = time.perf_counter() - started_at
+        operation = _operation(statement)
+        registry.query_duration.observe(elapsed, operation)
+
+        stats = getattr(_request_stats, 'current', None)
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+        if slow_query_threshold is not None and elapsed >= slow_query_threshold:
+            registry.slow_queries.inc(operation)
+            slow_query_logger.warning("Slow query (%.3fs): %s", elapsed,
+                                      ' '.join(statement.split())[:SLOW_QUERY_MAX_LENGTH])
+
+
+def instrument_storage(storage: DatabaseStorage, registry: MetricsRegistry):
+    """
+    Time every public method of a DatabaseStorage instance
+
+    Generator methods (the iter_* streams) are left alone, since their work happens
+    while the caller consumes them rather than during the call.
+
+    Args:
+        storage (DatabaseStorage): The storage instance to instrument
+        registry (MetricsRegistry): Where the timings are recorded
+
+    Returns:
+        DatabaseStorage: The same storage instance
+    """
+    for name, method in inspect.getmembers(type(storage), inspect.isfunction):
+        if name.startswith('_') or inspect.isgeneratorfunction(method):
+            continue
+        setattr(storage, name, _timed(getattr(storage, name), name, registry))
+    return storage
+
+
+def _timed(method, name, registry):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            registry.storage_errors.inc(name)
+            raise
+        finally:
+            registry.storage_duration.observe(time.perf_counter() - started, name)
+    return wrapper
+
+
+def instrument_app(app: Flask, registry: MetricsRegistry, path='/metrics'):
+    """
+    Record the latency and SQL statements of every request, and serve the metrics
+
+    Args:
+        app (Flask): The application
+        registry (MetricsRegistry): Where the timings are recorded
+        path (str): The URL the metrics are served at
+    """
+
+    @app.before_request
+    def start_timer():
+        g.request_started_at = time.perf_counter()
+        # [statement count, seconds in SQL], filled by instrument_engine
+        _request_stats.current = [0, 0.0]
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('request_started_at', None)
+        stats = getattr(_request_stats, 'current', None)
+        _request_stats.current = None
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        if route == path:
+            return response
+        registry.request_duration.observe(time.perf_counter() - started, request.method, route,
+                                          response.status_code)
+        if stats is not None:
+            registry.request_queries.observe(stats[0], request.method, route)
+            registry.request_query_duration.observe(stats[1], request.method, route)
+        return response
+
+    @app.route(path)
+    def metrics():
+        return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
+def slow_query_threshold_from_env(environ=None) -> Optional[float]:
+    """
+    Get the slow query threshold configured through the SLOW_QUERY_SECONDS environment variable
+
+    Args:
+        environ (dict): The environment, defaults to os.environ
+
+    Returns:
+        float: The threshold in seconds, None when the slow query log is disabled
+    """
+    environ = os.environ if environ is None else environ
+    value = environ.get('SLOW_QUERY_SECONDS')
+    return float(value) if value else None
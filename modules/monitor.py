@@ -0,0 +1,305 @@
+import glob
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, Iterator
+
+from modules.ingestion import iter_json_records, ingest_records, DEFAULT_BATCH_SIZE
+from modules.search_runner import run_all_searches, create_worker_pool
+from modules.storage import DatabaseStorage
+
+logger = logging.getLogger(__name__)
+
+# Minutes between runs of a search that has no interval_minutes of its own
+DEFAULT_SEARCH_INTERVAL = 60
+
+# Minutes between polls of the post source
+DEFAULT_INGEST_INTERVAL = 15
+
+# Fraction by which every interval is randomly stretched or shortened
+DEFAULT_JITTER = 0.1
+
+# Maximum number of search passes running at the same time
+DEFAULT_MAX_CONCURRENT = 2
+
+# Seconds between reloads of the saved searches, to pick up new, edited and deleted ones
+SEARCH_REFRESH_INTERVAL = 60
+
+_INGEST = 'ingest'
+
+
+class PostSource:
+    """
+    Interface of the sources the monitor ingests posts from
+    """
+
+    def fetch(self) -> Iterable[Dict]:
+        """
+        Get the scraped post records that appeared since the previous call
+
+        Returns:
+            Iterable[dict]: Records in the format accepted by modules.ingestion.post_from_record
+        """
+        raise NotImplementedError
+
+
+class FixtureSource(PostSource):
+    """
+    Reads scraped posts from local JSON/JSONL files
+
+    Every file matching the pattern is ingested once, on the first fetch after it
+    appears (or after it is modified), which lets the monitor run offline against
+    fixture exports dropped into a directory.
+    """
+
+    def __init__(self, pattern: str):
+        """
+        Args:
+            pattern (str): A file path, a directory (all *.json and *.jsonl files in it) or a glob pattern
+        """
+        if os.path.isdir(pattern):
+            self.patterns = [os.path.join(pattern, '*.json'), os.path.join(pattern, '*.jsonl')]
+        else:
+            self.patterns = [pattern]
+        self._seen = {}
+
+    def fetch(self) -> Iterator[Dict]:
+        paths = sorted({path for pattern in self.patterns for path in glob.glob(pattern)})
+        for path in paths:
+            modified = os.path.getmtime(path)
+            if self._seen.get(path) == modified:
+                continue
+            self._seen[path] = modified
+            logger.info("Reading posts from %s", path)
+            with open(path, encoding='utf-8') as stream:
+                yield from iter_json_records(stream)
+
+
+class Monitor:
+    """
+    Long-running scheduler that ingests new posts and runs saved searches incrementally
+
+    The post source is polled every ingest_interval minutes. Each search is due every
+    interval_minutes (or default_interval) minutes after its previous run; all searches due
+    at the same time are evaluated together in one pass over the new posts. Intervals are
+    jittered so that searches created together do not keep firing together, and at most
+    max_concurrent passes run at once.
+    """
+
+    def __init__(self, storage: DatabaseStorage, source: PostSource = None,
+                 default_interval=DEFAULT_SEARCH_INTERVAL, ingest_interval=DEFAULT_INGEST_INTERVAL,
+                 jitter=DEFAULT_JITTER, max_concurrent=DEFAULT_MAX_CONCURRENT, batch_size=DEFAULT_BATCH_SIZE,
+                 clock=time.monotonic, rng=None, notifier=None, in_database=False,
+                 workers=1, duplicate_filter=None):
+        """
+        Args:
+            storage (DatabaseStorage): The storage to ingest into and run searches on
+            source (PostSource): Where new posts come from, None to only run searches
+            default_interval (float): Minutes between runs of searches without their own interval
+            ingest_interval (float): Minutes between polls of the source
+            jitter (float): Fraction by which intervals are randomly stretched or shortened
+            max_concurrent (int): Maximum number of search passes running at the same time
+            batch_size (int): Posts written per ingestion transaction
+            clock (callable): Returns the current time in seconds
+            rng (random.Random): Random generator used for the jitter
+            notifier (NotificationDispatcher): Optional dispatcher told about new matches
+            in_database (bool): Run searches as INSERT ... SELECT statements, see run_search
+            workers (int): Processes matching the posts of each pass, see run_all_searches. They
+                are started once and shared by every pass until stop() is called.
+            duplicate_filter (DuplicateFilter): Optional near-duplicate filter applied to ingested
+                posts, as by scripts/load_posts.py --dedupe
+        """
+        self.storage = storage
+        self.source = source
+        self.default_interval = default_interval
+        self.ingest_interval = ingest_interval
+        self.jitter = jitter
+        self.batch_size = batch_size
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.notifier = notifier
+        self.in_database = in_database
+        self.workers = workers
+        self.duplicate_filter = duplicate_filter
+        # Processes are only spawned by the first pass large enough to use them
+        self.pool = create_worker_pool(storage, workers) if workers > 1 else None
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='monitor')
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._schedule = []  # Heap of (due_at, sequence, key), the sequence breaks ties
+        self._sequence = itertools.count()
+        self._searches = {}
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._searches_loaded_at = None
+
+    def _push(self, due_at, key):
+        # Callers hold self._lock
+        heapq.heappush(self._schedule, (due_at, next(self._sequence), key))
+
+    def _jittered(self, minutes):
+        seconds = minutes * 60
+        return seconds * (1 + self.rng.uniform(-self.jitter, self.jitter))
+
+    def interval_for(self, search) -> float:
+        """
+        Get the number of minutes between two runs of a search
+        """
+        return search.interval_minutes or self.default_interval
+
+    def refresh_searches(self):
+        """
+        Reload the saved searches and schedule the ones not scheduled yet
+
+        New searches are due immediately when they have never run, and one interval
+        after their previous run otherwise. Deleted searches are dropped from the schedule.
+        """
+        now = self.clock()
+        searches = {search.id: search for search in self.storage.get_all_searches()}
+        with self._lock:
+            known = {key for _, _, key in self._schedule} | self._running
+        new_entries = []
+        for search_id, search in searches.items():
+            if search_id in known:
+                continue
+            watermark = self.storage.get_watermark(search_id)
+            due_at = now
+            if watermark is not None:
+                elapsed = time.time() - watermark.last_run_at.timestamp()
+                due_at = now + max(self._jittered(self.interval_for(search)) - elapsed, 0)
+            new_entries.append((due_at, next(self._sequence), search_id))
+
+        with self._lock:
+            self._schedule = [entry for entry in self._schedule + new_entries
+                              if entry[2] == _INGEST or entry[2] in searches]
+            heapq.heapify(self._schedule)
+            self._searches = searches
+        self._searches_loaded_at = now
+
+    def ingest(self):
+        """
+        Poll the source once and ingest the posts it returns, through the duplicate filter if any
+
+        Returns:
+            IngestionStats: The ingestion counters, None without a source
+        """
+        if self.source is None:
+            return None
+        stats = ingest_records(self.storage, self.source.fetch(), batch_size=self.batch_size, log_every=0,
+                               duplicate_filter=self.duplicate_filter)
+        if stats.rows or stats.skipped:
+            logger.info("Ingested %s", stats)
+        return stats
+
+    def run_due(self, wait=False):
+        """
+        Run the ingestion and search passes that are due
+
+        Args:
+            wait (bool): Block until the search passes started by this call have finished
+
+        Returns:
+            list[int]: The IDs of the searches whose pass was started
+        """
+        now = self.clock()
+        if self._searches_loaded_at is None or now - self._searches_loaded_at >= SEARCH_REFRESH_INTERVAL:
+            self.refresh_searches()
+
+        due = []
+        ingest_due = False
+        with self._lock:
+            while self._schedule and self._schedule[0][0] <= now:
+                _, _, key = heapq.heappop(self._schedule)
+                if key == _INGEST:
+                    ingest_due = True
+                else:
+                    due.append(self._searches[key])
+
+        if ingest_due:
+            # New posts go in before the due searches run, so they are evaluated right away
+            try:
+                self.ingest()
+            finally:
+                with self._lock:
+                    self._push(self.clock() + self._jittered(self.ingest_interval), _INGEST)
+
+        if not due:
+            return []
+        if not self._slots.acquire(blocking=wait):
+            # Every slot is busy: retry these searches on the next tick
+            with self._lock:
+                for search in due:
+                    self._push(now, search.id)
+            return []
+
+        with self._lock:
+            self._running.update(search.id for search in due)
+        future = self.executor.submit(self._run_pass, due)
+        if wait:
+            future.result()
+        return [search.id for search in due]
+
+    def _run_pass(self, searches):
+        try:
+            counts = run_all_searches(self.storage, searches, notifier=self.notifier, in_database=self.in_database,
+                                      workers=self.workers, pool=self.pool)
+            logger.info("Ran %d searches, %d new matches", len(counts), sum(counts.values()))
+        except BrokenProcessPool:
+            # A worker died, e.g. killed for memory; later passes get a new pool
+            logger.exception("Search pass failed for searches %s", [search.id for search in searches])
+            with self._lock:
+                if not self._stop.is_set():
+                    self.pool = create_worker_pool(self.storage, self.workers)
+        except Exception:
+            logger.exception("Search pass failed for searches %s", [search.id for search in searches])
+        finally:
+            finished = self.clock()
+            with self._lock:
+                for search in searches:
+                    self._running.discard(search.id)
+                    if search.id in self._searches:
+                        self._push(finished + self._jittered(self.interval_for(search)), search.id)
+            self._slots.release()
+
+    def run_forever(self, tick=1.0):
+        """
+        Run the scheduler until stop() is called
+
+        Args:
+            tick (float): Seconds between two checks of the schedule
+        """
+        if self.source is not None:
+            with self._lock:
+                self._push(self.clock(), _INGEST)
+        while not self._stop.is_set():
+            try:
+                self.run_due()
+            except Exception:
+                logger.exception("Monitor tick failed")
+            self._stop.wait(tick)
+        self.executor.shutdown(wait=True)
+
+    def run_once(self):
+        """
+        Ingest once, then run every saved search once and wait for it to finish
+
+        Returns:
+            dict: The number of new matches, keyed by search ID
+        """
+        self.ingest()
+        return run_all_searches(self.storage, notifier=self.notifier, in_database=self.in_database,
+                                workers=self.workers, pool=self.pool)
+
+    def stop(self):
+        """
+        Make run_forever return and shut down the worker pool once its running passes finish
+        """
+        self._stop.set()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
@@ -0,0 +1,414 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import smtplib
+import threading
+import time
+import urllib.request
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from email.message import EmailMessage
+from typing import Optional
+
+from modules.storage import DatabaseStorage
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of pending match events; further events are dropped (and counted)
+DEFAULT_QUEUE_SIZE = 1000
+
+# Maximum number of matches listed in one digest
+DEFAULT_DIGEST_SIZE = 50
+
+# Seconds matches of a search are collected before their digest is sent
+DEFAULT_FLUSH_INTERVAL = 10.0
+
+# Delivery attempts per digest and sender before giving up
+DEFAULT_MAX_ATTEMPTS = 5
+
+# Seconds waited before the first retry; doubled on each further retry
+DEFAULT_BACKOFF = 1.0
+
+# Digests delivered per second by each sender, and the burst allowed above that rate
+DEFAULT_RATE = 1.0
+DEFAULT_BURST = 5
+
+# Characters of post content included in a digest
+SNIPPET_LENGTH = 200
+
+# Event asking the collector to publish every pending digest at once
+_FLUSH = object()
+
+
+@dataclass
+class Digest:
+    """
+    A batch of new matches of one search, delivered as a single notification
+    """
+    search_id: int
+    search_name: str
+    total_matches: int
+    matches: list = field(default_factory=list)  # Details of at most DEFAULT_DIGEST_SIZE matched posts
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+
+    def subject(self):
+        return f"{self.total_matches} new matches for '{self.search_name}'"
+
+    def text(self):
+        lines = [self.subject(), '']
+        for match in self.matches:
+            lines.append(f"- {match['user_name'] or 'Unknown'}: {match['snippet']}")
+            lines.append(f"  {match['post_url']}")
+        if self.total_matches > len(self.matches):
+            lines.append(f"... and {self.total_matches - len(self.matches)} more")
+        return '\n'.join(lines)
+
+
+class NotificationSender:
+    """
+    Interface of the channels digests are delivered through
+
+    send() raises on failure; the dispatcher takes care of retries and rate limiting.
+    """
+    name = 'sender'
+
+    async def send(self, digest: Digest):
+        raise NotImplementedError
+
+
+class WebhookSender(NotificationSender):
+    """
+    POSTs each digest as JSON to a URL
+    """
+    name = 'webhook'
+
+    def __init__(self, url: str, timeout=10.0, headers=None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json', **(headers or {})}
+
+    def _post(self, body: bytes):
+        request = urllib.request.Request(self.url, data=body, headers=self.headers, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    async def send(self, digest: Digest):
+        await asyncio.to_thread(self._post, json.dumps(asdict(digest)).encode())
+
+
+class SMTPSender(NotificationSender):
+    """
+    Emails each digest as plain text
+    """
+    name = 'smtp'
+
+    def __init__(self, host: str, port: int, sender: str, recipients: list[str],
+                 username=None, password=None, starttls=False, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = recipients
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def _send(self, digest: Digest):
+        message = EmailMessage()
+        message['Subject'] = digest.subject()
+        message['From'] = self.sender
+        message['To'] = ', '.join(self.recipients)
+        message.set_content(digest.text())
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+    async def send(self, digest: Digest):
+        await asyncio.to_thread(self._send, digest)
+
+
+class FileSender(NotificationSender):
+    """
+    Appends each digest as a JSON line to a file
+    """
+    name = 'file'
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _append(self, line: str):
+        with open(self.path, 'a', encoding='utf-8') as stream:
+            stream.write(line + '\n')
+
+    async def send(self, digest: Digest):
+        await asyncio.to_thread(self._append, json.dumps(asdict(digest)))
+
+
+class RateLimiter:
+    """
+    Token bucket allowing rate acquisitions per second with bursts of up to burst
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class NotificationDispatcher:
+    """
+    Delivers digests of new matches through pluggable senders, off the matching thread
+
+    notify() only enqueues and never blocks: the dispatcher runs its own asyncio event
+    loop in a background thread. Matches are collected per search for flush_interval
+    seconds (or until digest_size are pending) and turned into one digest, which every
+    sender delivers through its own bounded queue, rate limiter and retry loop with
+    exponential backoff. When a queue is full the event or digest is dropped and
+    counted in stats rather than slowing down the producer.
+    """
+
+    def __init__(self, storage: DatabaseStorage, senders: list[NotificationSender],
+                 queue_size=DEFAULT_QUEUE_SIZE, digest_size=DEFAULT_DIGEST_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 backoff=DEFAULT_BACKOFF, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        """
+        Args:
+            storage (DatabaseStorage): Used to look up the matched posts listed in digests
+            senders (list[NotificationSender]): The channels every digest is delivered through
+            queue_size (int): Capacity of the event queue and of each sender queue
+            digest_size (int): Maximum number of matches listed per digest
+            flush_interval (float): Seconds matches are collected before a digest is sent
+            max_attempts (int): Delivery attempts per digest and sender
+            backoff (float): Seconds before the first retry, doubled on each further retry
+            rate (float): Digests delivered per second by each sender
+            burst (int): Digests a sender may deliver in a burst above the rate
+        """
+        self.storage = storage
+        self.senders = senders
+        self.queue_size = queue_size
+        self.digest_size = digest_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.rate = rate
+        self.burst = burst
+        self.stats = {'events': 0, 'dropped_events': 0, 'digests': 0, 'delivered': 0,
+                      'retries': 0, 'failed': 0, 'dropped_digests': 0}
+        self._loop = None
+        self._thread = None
+        self._events = None
+        self._sender_queues = []
+        self._started = threading.Event()
+        # Serializes start() and close(), so concurrent first notifies start a single loop
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the background event loop; called automatically by the first notify()
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._started.clear()
+            self._thread = threading.Thread(target=self._run_loop, name='notifications', daemon=True)
+            self._thread.start()
+            self._started.wait()
+
+    def notify(self, search, post_ids: list[int]):
+        """
+        Enqueue new matches of a search; returns immediately
+
+        Args:
+            search (Search): The search that matched, ignored unless search.notify is set
+            post_ids (list[int]): The IDs of the newly matched posts
+        """
+        if not post_ids or not getattr(search, 'notify', False):
+            return
+        self.start()
+        self._loop.call_soon_threadsafe(self._enqueue_event, (search.id, search.name, list(post_ids)))
+
+    def close(self, timeout=30.0):
+        """
+        Flush pending matches, wait for queued digests to be delivered and stop the loop
+
+        Args:
+            timeout (float): Maximum seconds to wait for delivery
+        """
+        with self._lock:
+            if self._thread is None:
+                return
+            future = asyncio.run_coroutine_threadsafe(self._drain(), self._loop)
+            try:
+                future.result(timeout)
+            finally:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join(timeout)
+                self._thread = None
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._events = asyncio.Queue(maxsize=self.queue_size)
+        sender_queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.senders]
+        tasks = [self._loop.create_task(self._deliver(sender, queue))
+                 for sender, queue in zip(self.senders, sender_queues)]
+        tasks.append(self._loop.create_task(self._collect()))
+        # Replaced as a whole, so a restarted loop never publishes to the queues of a closed one
+        self._sender_queues = sender_queues
+        self._started.set()
+        self._loop.run_forever()
+        for task in tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.close()
+
+    def _enqueue_event(self, event):
+        self.stats['events'] += 1
+        try:
+            self._events.put_nowait(event)
+        except asyncio.QueueFull:
+            self.stats['dropped_events'] += 1
+            logger.warning("Notification queue full, dropping %d matches of search %s", len(event[2]), event[0])
+
+    async def _collect(self):
+        pending = {}  # search_id -> (search_name, post_ids, first_seen)
+        while True:
+            timeout = None
+            if pending:
+                oldest = min(first_seen for _, _, first_seen in pending.values())
+                timeout = max(oldest + self.flush_interval - time.monotonic(), 0)
+            try:
+                event = await asyncio.wait_for(self._events.get(), timeout)
+            except asyncio.TimeoutError:
+                event = None
+            try:
+                if event is not None and event is not _FLUSH:
+                    search_id, search_name, post_ids = event
+                    pending.setdefault(search_id, (search_name, [], time.monotonic()))[1].extend(post_ids)
+
+                now = time.monotonic()
+                for search_id in list(pending):
+                    search_name, post_ids, first_seen = pending[search_id]
+                    if event is _FLUSH or now - first_seen >= self.flush_interval or len(post_ids) >= self.digest_size:
+                        del pending[search_id]
+                        try:
+                            await self._publish(search_id, search_name, post_ids)
+                        except Exception as e:
+                            # A failed lookup loses this digest, not the collector
+                            self.stats['failed'] += 1
+                            logger.error("Could not publish digest for search %s: %s", search_id, e)
+            finally:
+                if event is not None:
+                    # Only now, so that _drain's join() also waits for the digests to be published
+                    self._events.task_done()
+
+    async def _publish(self, search_id, search_name, post_ids):
+        posts = await asyncio.to_thread(self.storage.get_posts_by_ids, post_ids[:self.digest_size])
+        digest = Digest(
+            search_id=search_id,
+            search_name=search_name,
+            total_matches=len(post_ids),
+            matches=[{
+                'post_id': post.id,
+                'post_url': post.post_url,
+                'user_name': post.user_name,
+                'snippet': post.content[:SNIPPET_LENGTH],
+                'timestamp': post.timestamp.isoformat(),
+            } for post in posts],
+        )
+        self.stats['digests'] += 1
+        for queue in self._sender_queues:
+            try:
+                queue.put_nowait(digest)
+            except asyncio.QueueFull:
+                self.stats['dropped_digests'] += 1
+                logger.warning("Sender queue full, dropping digest for search %s", search_id)
+
+    async def _deliver(self, sender: NotificationSender, queue: asyncio.Queue):
+        limiter = RateLimiter(self.rate, self.burst)
+        while True:
+            digest = await queue.get()
+            try:
+                for attempt in range(1, self.max_attempts + 1):
+                    await limiter.acquire()
+                    try:
+                        await sender.send(digest)
+                        self.stats['delivered'] += 1
+                        break
+                    except Exception as e:
+                        if attempt == self.max_attempts:
+                            self.stats['failed'] += 1
+                            logger.error("Giving up on %s digest for search %s: %s", sender.name, digest.search_id, e)
+                            break
+                        self.stats['retries'] += 1
+                        delay = self.backoff * 2 ** (attempt - 1)
+                        await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            finally:
+                queue.task_done()
+
+    async def _drain(self):
+        await self._events.put(_FLUSH)
+        await self._events.join()
+        for queue in self._sender_queues:
+            await queue.join()
+
+
+def senders_from_env(environ=None) -> list[NotificationSender]:
+    """
+    Build the senders configured through environment variables
+
+    NOTIFY_WEBHOOK_URL enables the webhook sender, NOTIFY_FILE the file sink, and
+    NOTIFY_SMTP_HOST (with NOTIFY_SMTP_PORT, NOTIFY_SMTP_FROM, NOTIFY_SMTP_TO as a
+    comma-separated list, and optionally NOTIFY_SMTP_USER, NOTIFY_SMTP_PASSWORD and
+    NOTIFY_SMTP_STARTTLS) the email sender.
+
+    Args:
+        environ (dict): The environment, defaults to os.environ
+
+    Returns:
+        list[NotificationSender]: The configured senders, possibly empty
+    """
+    environ = os.environ if environ is None else environ
+    senders = []
+    if environ.get('NOTIFY_WEBHOOK_URL'):
+        senders.append(WebhookSender(environ['NOTIFY_WEBHOOK_URL']))
+    if environ.get('NOTIFY_SMTP_HOST'):
+        senders.append(SMTPSender(
+            host=environ['NOTIFY_SMTP_HOST'],
+            port=int(environ.get('NOTIFY_SMTP_PORT', 25)),
+            sender=environ.get('NOTIFY_SMTP_FROM', 'linkedin-monitor@localhost'),
+            recipients=[r.strip() for r in environ.get('NOTIFY_SMTP_TO', '').split(',') if r.strip()],
+            username=environ.get('NOTIFY_SMTP_USER'),
+            password=environ.get('NOTIFY_SMTP_PASSWORD'),
+            starttls=environ.get('NOTIFY_SMTP_STARTTLS', '').lower() in ('1', 'true', 'yes'),
+        ))
+    if environ.get('NOTIFY_FILE'):
+        senders.append(FileSender(environ['NOTIFY_FILE']))
+    return senders
+
+
+def dispatcher_from_env(storage: DatabaseStorage, environ=None) -> Optional[NotificationDispatcher]:
+    """
+    Create a dispatcher for the senders configured in the environment
+
+    Returns:
+        NotificationDispatcher: The dispatcher, None if no sender is configured
+    """
+    senders = senders_from_env(environ)
+    return NotificationDispatcher(storage, senders) if senders else None
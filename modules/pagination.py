@@ -0,0 +1,52 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+# Directions a cursor can point to, relative to the page it was generated from
+NEXT = 'next'
+PREV = 'prev'
+
+
+def encode_cursor(sort_value, row_id: int, direction=NEXT) -> str:
+    """
+    Encode a keyset position into an opaque, URL-safe cursor
+
+    Args:
+        sort_value (datetime | float): The value of the sort column at the boundary row
+        row_id (int): The ID of the boundary row, used as a tie-breaker
+        direction (str): NEXT for the rows after the boundary, PREV for the rows before it
+
+    Returns:
+        str: The cursor
+    """
+    # Datetimes travel as ISO strings, numeric sort values (relevance scores) as JSON numbers
+    value = sort_value.isoformat() if isinstance(sort_value, datetime) else sort_value
+    payload = json.dumps([value, row_id, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """
+    Decode a cursor produced by encode_cursor
+
+    Args:
+        cursor (str): The cursor, may be None or empty
+
+    Returns:
+        tuple: (sort_value, row_id, direction), or None if the cursor is missing or malformed
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id, direction = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in (NEXT, PREV):
+            return None
+        if isinstance(sort_value, str):
+            sort_value = datetime.fromisoformat(sort_value)
+        elif not isinstance(sort_value, (int, float)) or isinstance(sort_value, bool):
+            return None
+        return sort_value, int(row_id), direction
+    except (binascii.Error, ValueError, TypeError):
+        return None
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterable, Dict, Iterable, Union
+
+from modules.async_storage import AsyncDatabaseStorage
+from modules.ingestion import IngestionStats, DEFAULT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Ingested batches waiting for matching before ingestion pauses
+DEFAULT_QUEUE_SIZE = 4
+
+# Put on the queue by the producer after its last batch
+_DONE = object()
+
+
+@dataclass
+class PipelineStats:
+    """
+    Counters reported by a pipeline run
+    """
+    ingestion: IngestionStats = field(default_factory=IngestionStats)
+    search_passes: int = 0
+    matches: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        return (f"{self.ingestion.rows} posts in {self.ingestion.batches} batches, {self.search_passes} search "
+                f"passes, {self.matches} matches, {self.seconds:.1f}s")
+
+
+def _add_batch(total: IngestionStats, batch: IngestionStats):
+    total.rows += batch.rows
+    total.skipped += batch.skipped
+    total.duplicates += batch.duplicates
+    total.snapshots += batch.snapshots
+    total.batches += batch.batches
+
+
+async def _iterate(records):
+    if hasattr(records, '__aiter__'):
+        async for record in records:
+            yield record
+    else:
+        for record in records:
+            yield record
+
+
+async def run_pipeline(storage: AsyncDatabaseStorage, records: Union[Iterable[Dict], AsyncIterable[Dict]],
+                       batch_size=DEFAULT_BATCH_SIZE, queue_size=DEFAULT_QUEUE_SIZE, searches=None, notifier=None,
+                       in_database=False, duplicate_filter=None, track_engagement=True) -> PipelineStats:
+    """
+    Ingest scraped records and match the new posts against the saved searches as they arrive
+
+    A producer groups the records into batches and writes each one in its own transaction;
+    every written batch goes through a bounded queue to a consumer that runs an incremental
+    pass of the searches, which only evaluates the posts above each search's watermark. The
+    two overlap: the next batch is scraped and written while the previous one is matched.
+    When matching falls behind, at most queue_size batches wait before the producer is
+    paused, and all the batches waiting are matched by a single pass.
+
+    Args:
+        storage (AsyncDatabaseStorage): The storage, already set up
+        records (Iterable[dict] or AsyncIterable[dict]): The scraped records, e.g. from an async scraper
+        batch_size (int): The number of records written per transaction
+        queue_size (int): The number of written batches that may wait for matching
+        searches (list[SearchView], optional): The searches to run. Defaults to all saved searches,
+            reloaded for every pass.
+        notifier (NotificationDispatcher): Optional dispatcher told about matches of new posts
+        in_database (bool): If True, match with INSERT ... SELECT statements, see run_search
+        duplicate_filter (DuplicateFilter): Optional near-duplicate filter, see modules/dedup.py
+        track_engagement (bool): Append an engagement snapshot of every written post
+
+    Returns:
+        PipelineStats: Ingestion, matching and duration counters for the run
+    """
+    stats = PipelineStats()
+    queue = asyncio.Queue(maxsize=queue_size)
+    started = time.perf_counter()
+
+    async def write(batch):
+        batch_stats = await storage.ingest_records(batch, batch_size=len(batch), duplicate_filter=duplicate_filter,
+                                                   track_engagement=track_engagement)
+        _add_batch(stats.ingestion, batch_stats)
+        await queue.put(batch_stats)
+
+    async def produce():
+        batch = []
+        async for record in _iterate(records):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                await write(batch)
+                batch = []
+        if batch:
+            await write(batch)
+        await queue.put(_DONE)
+
+    async def consume():
+        while True:
+            items = [await queue.get()]
+            # Posts of every batch written so far are above the watermarks, so one pass matches them all
+            while not queue.empty():
+                items.append(queue.get_nowait())
+            done = any(item is _DONE for item in items)
+            if len(items) > done:
+                counts = await storage.run_all_searches(searches, notifier=notifier, in_database=in_database)
+                stats.search_passes += 1
+                stats.matches += sum(counts.values())
+                logger.info("Matched %s batches: %s matches", len(items) - done, sum(counts.values()))
+            if done:
+                return
+
+    async with asyncio.TaskGroup() as tasks:
+        tasks.create_task(produce())
+        tasks.create_task(consume())
+
+    stats.seconds = time.perf_counter() - started
+    stats.ingestion.seconds = stats.seconds
+    return stats
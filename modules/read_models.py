@@ -0,0 +1,148 @@
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Optional
+
+from database.Models import Search, Match, Post, PostEngagement
+
+
+@dataclass(frozen=True, slots=True)
+class SearchView:
+    """
+    Read-only snapshot of a saved search and its criteria
+    """
+    id: int
+    name: str
+    type: str
+    notify: bool
+    interval_minutes: Optional[int]
+    version: int
+    terms: tuple = ()  # Keywords of topic/job searches
+    users: tuple = ()  # User names of user searches
+
+    @property
+    def keywords(self) -> Optional[str]:
+        # Comma-separated, as entered in the search forms
+        return ', '.join(self.terms) or None
+
+    @property
+    def usernames(self) -> Optional[str]:
+        return ', '.join(self.users) or None
+
+
+@dataclass(frozen=True, slots=True)
+class PostView:
+    """
+    Read-only snapshot of a post, as shown in post and match listings
+    """
+    id: int
+    post_url: str
+    user_name: Optional[str]
+    user_url: Optional[str]
+    content: str
+    timestamp: datetime
+    likes: int
+    comments: int
+    shares: int
+
+
+@dataclass(frozen=True, slots=True)
+class MatchView:
+    """
+    Read-only snapshot of a match together with the post it matched
+    """
+    id: int
+    search_id: int
+    post_id: int
+    matched_at: datetime
+    relevance: float
+    post: Optional[PostView]
+
+
+@dataclass(frozen=True, slots=True)
+class SearchStatsView:
+    """
+    Read-only match statistics of a search, as shown on the dashboard
+    """
+    matches: int = 0
+    recent_matches: int = 0  # Matches of posts published in the recent window, see get_search_stats
+    last_matched_at: Optional[datetime] = None
+
+
+@dataclass(frozen=True, slots=True)
+class SearchActivityView:
+    """
+    Read-only breakdown of the matches of a search by day and by author
+    """
+    daily: tuple = ()  # (day, matches) pairs, oldest day first
+    top_authors: tuple = ()  # (user_name, matches) pairs, most matches first
+
+
+@dataclass(frozen=True, slots=True)
+class SnapshotView:
+    """
+    Read-only engagement counters of a post at one point in time
+    """
+    captured_at: datetime
+    likes: int
+    comments: int
+    shares: int
+
+
+@dataclass(frozen=True, slots=True)
+class GrowthView:
+    """
+    Read-only engagement rollup of a post, as ranked by the fastest-growing queries
+    """
+    growth_per_hour: float
+    interactions: int
+    snapshots: int
+    last_captured_at: datetime
+    post: PostView
+
+
+def columns(view, model, exclude=()):
+    """
+    Get the model columns backing the fields of a read model, for column-projection queries
+
+    Args:
+        view (type): The read model class
+        model (type): The ORM model the fields are read from
+        exclude (tuple): Field names that are not model columns
+
+    Returns:
+        list: The model columns, in field order
+    """
+    return [getattr(model, field.name) for field in fields(view) if field.name not in exclude]
+
+
+def search_view(row, terms=(), users=()) -> SearchView:
+    return SearchView(*row, terms=tuple(terms), users=tuple(users))
+
+
+def post_view(row) -> PostView:
+    return PostView(*row)
+
+
+def snapshot_view(row) -> SnapshotView:
+    # Snapshots store Unix times, read models expose local datetimes like the other tables
+    return SnapshotView(datetime.fromtimestamp(row[0]), *row[1:])
+
+
+def growth_view(row) -> GrowthView:
+    # Rows select the rollup columns followed by the post columns
+    growth_per_hour, interactions, snapshots, last_captured_at = row[:4]
+    return GrowthView(growth_per_hour, interactions, snapshots, datetime.fromtimestamp(last_captured_at),
+                      post=PostView(*row[4:]))
+
+
+def match_view(row) -> MatchView:
+    # Rows select the match columns followed by the post columns, the latter NULL for a missing post
+    match_values, post_values = row[:5], row[5:]
+    post = PostView(*post_values) if post_values[0] is not None else None
+    return MatchView(*match_values, post=post)
+
+
+SEARCH_COLUMNS = columns(SearchView, Search, exclude=('terms', 'users'))
+POST_COLUMNS = columns(PostView, Post)
+MATCH_COLUMNS = columns(MatchView, Match, exclude=('post',))
+GROWTH_COLUMNS = columns(GrowthView, PostEngagement, exclude=('post',))
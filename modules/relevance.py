@@ -0,0 +1,186 @@
+import calendar
+import math
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import func, extract, literal
+
+from database.Models import Post
+from modules.storage import DatabaseStorage
+
+# BM25 term frequency saturation and document length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Weight of the BM25 keyword score in the relevance
+KEYWORD_WEIGHT = 1.0
+
+# Weight of the log-scaled engagement in the relevance
+ENGAGEMENT_WEIGHT = 0.5
+
+# Engagement counted per like, comment and share
+LIKE_WEIGHT = 1.0
+COMMENT_WEIGHT = 2.0
+SHARE_WEIGHT = 3.0
+
+# Days after which a post needs one more unit of relevance to rank as high as a fresh one. Relevance is
+# log-scaled, so this is the e-folding time of the decay: the half-life is ln 2 times this, about 4.9 days
+RECENCY_DAYS_PER_UNIT = 7.0
+
+# Reference time of the recency term
+RECENCY_EPOCH = datetime(2020, 1, 1)
+
+# Posts scored at a time
+SCORING_BATCH_SIZE = 5000
+
+
+@dataclass
+class CorpusStatistics:
+    """
+    Corpus-wide figures BM25 needs, fetched once per scoring run
+    """
+    post_count: int
+    average_length: float
+    document_frequencies: dict
+
+    @classmethod
+    def load(cls, storage: DatabaseStorage, keywords: list[str]):
+        return cls(
+            post_count=storage.count_posts(),
+            average_length=storage.get_average_post_length(),
+            document_frequencies={keyword.lower(): storage.count_posts_with_keyword(keyword) for keyword in keywords},
+        )
+
+    def idf(self, keyword: str) -> float:
+        frequency = self.document_frequencies.get(keyword, 0)
+        return math.log(1 + (self.post_count - frequency + 0.5) / (frequency + 0.5))
+
+
+def bm25_scores(contents: list[str], keywords: list[str], statistics: CorpusStatistics) -> list[float]:
+    """
+    Score a batch of post contents against keywords with Okapi BM25
+
+    Term frequencies are counted as case-insensitive substring occurrences, the same
+    semantics the keyword matching uses, and lengths are measured in characters.
+
+    Args:
+        contents (list[str]): The post contents
+        keywords (list[str]): The search keywords
+        statistics (CorpusStatistics): Post count, average length and keyword document frequencies
+
+    Returns:
+        list[float]: The BM25 score of each content, in input order
+    """
+    if not keywords:
+        return [0.0] * len(contents)
+    lowered = [content.lower() for content in contents]
+    average_length = statistics.average_length or 1.0
+    # Per-document length normalization, shared by every keyword
+    norms = [BM25_K1 * (1 - BM25_B + BM25_B * len(content) / average_length) for content in lowered]
+    scores = [0.0] * len(contents)
+    for keyword in {keyword.lower() for keyword in keywords}:
+        idf = statistics.idf(keyword)
+        for i, (content, norm) in enumerate(zip(lowered, norms)):
+            frequency = content.count(keyword)
+            if frequency:
+                scores[i] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+    return scores
+
+
+def engagement_scores(likes: list[int], comments: list[int], shares: list[int]) -> list[float]:
+    """
+    Log-scaled weighted engagement of a batch of posts
+    """
+    return [math.log1p(LIKE_WEIGHT * (l or 0) + COMMENT_WEIGHT * (c or 0) + SHARE_WEIGHT * (s or 0))
+            for l, c, s in zip(likes, comments, shares)]
+
+
+def recency_scores(timestamps: list[datetime]) -> list[float]:
+    """
+    Recency term of a batch of posts: one unit per RECENCY_DAYS_PER_UNIT since RECENCY_EPOCH
+
+    Adding a linear time term to log-scaled scores is an exponential decay that does not
+    depend on the current time, so stored relevance scores never need to be recomputed
+    as they age: a post RECENCY_DAYS_PER_UNIT days older needs one more unit elsewhere,
+    i.e. e times the engagement, to rank equal.
+    """
+    unit = RECENCY_DAYS_PER_UNIT * 86400
+    return [(timestamp - RECENCY_EPOCH).total_seconds() / unit for timestamp in timestamps]
+
+
+def score_rows(rows, keywords: list[str], statistics: CorpusStatistics) -> dict:
+    """
+    Compute the relevance of a batch of posts
+
+    Args:
+        rows (list): Rows with id, content, likes, comments, shares and timestamp attributes
+        keywords (list[str]): The search keywords, empty for user searches
+        statistics (CorpusStatistics): The corpus statistics for the keywords
+
+    Returns:
+        dict: The relevance of each post, keyed by post ID
+    """
+    ids, contents, likes, comments, shares, timestamps = zip(*rows) if rows else ((),) * 6
+    keyword = bm25_scores(list(contents), keywords, statistics)
+    engagement = engagement_scores(likes, comments, shares)
+    recency = recency_scores(timestamps)
+    return {post_id: KEYWORD_WEIGHT * k + ENGAGEMENT_WEIGHT * e + r
+            for post_id, k, e, r in zip(ids, keyword, engagement, recency)}
+
+
+def relevance_expression(keywords: list[str], statistics: CorpusStatistics):
+    """
+    Build the SQL counterpart of score_rows, for matches computed inside the database
+
+    Term frequencies are counted as the characters removed by replacing the keyword in the
+    lowercased content, divided by the keyword length, which counts non-overlapping
+    occurrences exactly like str.count. Lowercasing follows the database, i.e. ASCII only
+    on SQLite.
+
+    Args:
+        keywords (list[str]): The search keywords, empty for user searches
+        statistics (CorpusStatistics): The corpus statistics for the keywords
+
+    Returns:
+        ColumnElement: An expression over posts giving the relevance of each post
+    """
+    content = func.lower(Post.content)
+    length = func.length(Post.content)
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (statistics.average_length or 1.0))
+    keyword = literal(0.0)
+    for term in {keyword.lower() for keyword in keywords}:
+        frequency = (length - func.length(func.replace(content, term, ''))) / len(term)
+        keyword = keyword + statistics.idf(term) * frequency * (BM25_K1 + 1) / (frequency + norm)
+    engagement = func.ln(1 + LIKE_WEIGHT * func.coalesce(Post.likes, 0) + COMMENT_WEIGHT * func.coalesce(Post.comments, 0)
+                         + SHARE_WEIGHT * func.coalesce(Post.shares, 0))
+    recency = (extract('epoch', Post.timestamp) - calendar.timegm(RECENCY_EPOCH.timetuple())) / (
+        RECENCY_DAYS_PER_UNIT * 86400)
+    return KEYWORD_WEIGHT * keyword + ENGAGEMENT_WEIGHT * engagement + recency
+
+
+def score_matches(storage: DatabaseStorage, post_ids: list[int], keywords: list[str], statistics=None) -> dict:
+    """
+    Compute the relevance of the posts matched by a search
+
+    Args:
+        storage (DatabaseStorage): The storage to read the posts from
+        post_ids (list[int]): The matched post IDs
+        keywords (list[str]): The search keywords, empty for user searches
+        statistics (CorpusStatistics, optional): The corpus statistics for the keywords, loaded
+            from the storage by default
+
+    Returns:
+        dict: The relevance of each post, keyed by post ID
+    """
+    if not post_ids:
+        return {}
+    statistics = statistics or CorpusStatistics.load(storage, keywords)
+    scores = {}
+    batch = []
+    for row in storage.iter_scoring_rows(post_ids):
+        batch.append(row)
+        if len(batch) >= SCORING_BATCH_SIZE:
+            scores.update(score_rows(batch, keywords, statistics))
+            batch = []
+    scores.update(score_rows(batch, keywords, statistics))
+    return scores
@@ -0,0 +1,413 @@
+import multiprocessing
+import threading
+from collections import OrderedDict
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from database.database import create_read_only_engine
+from modules.matcher import MultiSearchMatcher
+from modules.read_models import SearchView
+from modules.relevance import score_matches, relevance_expression, CorpusStatistics
+from modules.storage import DatabaseStorage, POST_STREAM_BATCH_SIZE, MATCH_BY_TERMS, MATCH_BY_USERS
+
+# Search types whose criteria are keywords matched against post content
+KEYWORD_SEARCH_TYPES = ('topic', 'job')
+
+# Number of compiled matchers kept by the matcher cache
+MATCHER_CACHE_SIZE = 16
+
+# Post ID shards per worker process, so that a worker done with a sparse shard picks up another one
+SHARDS_PER_WORKER = 4
+
+# Post ID ranges narrower than this are scanned in-process when the worker processes have to be started for the
+# run: starting a worker costs about a second, while a single process matches some 15000 posts per second
+PARALLEL_MIN_POSTS = 50000
+
+# Post ID ranges narrower than this are scanned in-process even when a started worker pool is passed in, since
+# shipping the searches to the workers and merging their results costs more than matching a few batches
+POOL_MIN_POSTS = 10000
+
+# Workers are spawned rather than forked, since the web app and the monitor run searches from threads
+WORKER_START_METHOD = 'spawn'
+
+
+def _keywords(search: SearchView) -> list[str]:
+    # The keywords a search's matches are scored against, none for user searches
+    return list(search.terms) if search.type in KEYWORD_SEARCH_TYPES else []
+
+
+def _notifies(search: SearchView, watermark, notifier) -> bool:
+    # Whether the new matches of a run are announced: only for searches with notifications on, and
+    # never on a first run, which backfills the search's history silently
+    return notifier is not None and watermark is not None and search.notify
+
+
+def _save_matches(storage: DatabaseStorage, search: SearchView, post_ids: list[int], watermark, replace: bool,
+                  up_to_post_id: int, notifier=None, scores=None):
+    """
+    Write the matches of a run, advance the watermark and hand the new matches to the notifier
+
+    Each match is stored with its relevance score, computed here unless the caller already
+    did. Only posts above the previous watermark count as new: the first run of a search
+    backfills its history silently, and a full rebuild does not re-announce old posts.
+    """
+    now = datetime.now()
+    if scores is None:
+        scores = score_matches(storage, post_ids, _keywords(search))
+    matches = [{"post_id": post_id, "matched_at": now, "relevance": scores.get(post_id)} for post_id in post_ids]
+    count = storage.save_matches(search.id, matches, replace=replace, last_post_id=up_to_post_id)
+    if _notifies(search, watermark, notifier):
+        notifier.notify(search, [post_id for post_id in post_ids if post_id > watermark.last_post_id])
+    return count
+
+
+def _insert_matches(storage: DatabaseStorage, search: SearchView, watermark, after_post_id, up_to_post_id: int,
+                    notifier=None):
+    """
+    Evaluate a search and write its matches with a single INSERT ... SELECT inside the database
+
+    Relevance is computed by the same statement; the IDs of new matches are only read back
+    when a notifier has to be told about them.
+    """
+    if search.type == 'user':
+        match_by, keywords = MATCH_BY_USERS, []
+    elif search.type in KEYWORD_SEARCH_TYPES:
+        match_by, keywords = MATCH_BY_TERMS, list(search.terms)
+    else:
+        return _save_matches(storage, search, [], watermark, replace=after_post_id is None,
+                             up_to_post_id=up_to_post_id, notifier=notifier)
+    relevance = relevance_expression(keywords, CorpusStatistics.load(storage, keywords))
+    count = storage.insert_search_matches(search.id, match_by, replace=after_post_id is None,
+                                          after_post_id=after_post_id, up_to_post_id=up_to_post_id,
+                                          relevance=relevance, last_post_id=up_to_post_id)
+    if _notifies(search, watermark, notifier) and count:
+        notifier.notify(search, storage.get_matched_post_ids(search.id, after_post_id=watermark.last_post_id))
+    return count
+
+
+def run_search(storage: DatabaseStorage, search: SearchView, full_rebuild=False, progress=None, notifier=None,
+               in_database=False):
+    """
+    Evaluate a saved search and store its matches
+
+    A search that has run before only evaluates posts added since its watermark and
+    appends the new matches. The first run, or a run with full_rebuild=True (e.g. after
+    the search criteria changed), evaluates every post and replaces all existing matches.
+    Either way the watermark is advanced in the same transaction as the match write.
+
+    Args:
+        storage (DatabaseStorage): The storage to read posts from and write matches to
+        search (SearchView): The search to evaluate
+        full_rebuild (bool): If True, ignore the watermark and re-evaluate the whole corpus
+        progress (callable): Optional callback receiving the fraction of work done, from 0 to 1
+        notifier (NotificationDispatcher): Optional dispatcher told about matches of new posts
+        in_database (bool): If True, match and score the posts with a single INSERT ... SELECT
+            instead of reading the matched post IDs into Python
+
+    Returns:
+        int: The number of matches written; in_database runs do not count posts already matched
+    """
+    up_to_post_id = storage.get_max_post_id()
+    watermark = storage.get_watermark(search.id)
+    after_post_id = watermark.last_post_id if watermark and not full_rebuild else None
+
+    if in_database:
+        return _insert_matches(storage, search, watermark, after_post_id, up_to_post_id, notifier=notifier)
+
+    matched_post_ids = []
+    if search.type == 'user':
+        if search.users:
+            matched_post_ids = storage.get_post_ids_by_search_users(
+                search.id, after_post_id=after_post_id, up_to_post_id=up_to_post_id)
+    elif search.type in KEYWORD_SEARCH_TYPES:
+        if search.terms:
+            matched_post_ids = storage.get_post_ids_by_keywords(
+                list(search.terms), after_post_id=after_post_id, up_to_post_id=up_to_post_id)
+
+    if progress:
+        progress(0.5)
+
+    return _save_matches(storage, search, matched_post_ids, watermark, replace=after_post_id is None,
+                         up_to_post_id=up_to_post_id, notifier=notifier)
+
+
+def compile_matcher(searches: list[SearchView]) -> MultiSearchMatcher:
+    """
+    Compile the criteria of several searches into a single matcher
+
+    Args:
+        searches (list[SearchView]): The searches to compile
+
+    Returns:
+        MultiSearchMatcher: A matcher reporting the IDs of the searches matching a post
+    """
+    matcher = MultiSearchMatcher()
+    for search in searches:
+        if search.type == 'user':
+            matcher.add_usernames(search.id, search.users)
+        elif search.type in KEYWORD_SEARCH_TYPES:
+            matcher.add_keywords(search.id, search.terms)
+    return matcher
+
+
+class MatcherCache:
+    """
+    Compiled matchers keyed by the IDs and criteria of the searches they were built from
+
+    The key holds the criteria themselves rather than the search versions: SQLite reuses
+    the ID of a deleted search, and the search created in its place starts again at
+    version 1. Changed criteria simply miss, and the old entry ages out of the cache.
+    """
+
+    def __init__(self, max_entries=MATCHER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._matchers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, searches: list[SearchView]) -> MultiSearchMatcher:
+        """
+        Get the compiled matcher of a set of searches, compiling it on a miss
+
+        Args:
+            searches (list[SearchView]): The searches to match
+
+        Returns:
+            MultiSearchMatcher: The matcher
+        """
+        key = frozenset((search.id, search.type, search.terms, search.users) for search in searches)
+        with self._lock:
+            matcher = self._matchers.get(key)
+            if matcher is not None:
+                self._matchers.move_to_end(key)
+                return matcher
+        matcher = compile_matcher(searches)
+        # Build the automaton now rather than on first use, since the matcher is shared between threads
+        matcher.keywords.build()
+        with self._lock:
+            self._matchers[key] = matcher
+            while len(self._matchers) > self.max_entries:
+                self._matchers.popitem(last=False)
+        return matcher
+
+    def clear(self):
+        with self._lock:
+            self._matchers.clear()
+
+
+# Shared by every run in the process; matchers are read-only once built
+matcher_cache = MatcherCache()
+
+
+def _match_rows(matcher: MultiSearchMatcher, rows, after_post_ids: dict, matched_post_ids: dict):
+    # Record each post under the searches it matches, for searches whose watermark is below it
+    for post in rows:
+        for search_id in matcher.match(post.user_name, post.content):
+            after = after_post_ids[search_id]
+            if after is None or post.id > after:
+                matched_post_ids[search_id].append(post.id)
+
+
+# State of a worker process: its read-only storage, set by _init_worker
+_worker = {}
+
+
+def _init_worker(db_path: str):
+    _worker['storage'] = DatabaseStorage(engine=create_read_only_engine(db_path))
+
+
+def _match_shard(searches: list[SearchView], after_post_ids: dict, statistics: dict, after_post_id: int,
+                 up_to_post_id: int):
+    """
+    Match and score the posts of one ID range, in a worker process
+
+    Returns:
+        tuple: (matched post IDs, relevance scores), both dictionaries keyed by search ID
+    """
+    storage = _worker['storage']
+    # Compiled once per worker and reused for every shard of the run
+    matcher = matcher_cache.get(searches)
+    matched_post_ids = {search.id: [] for search in searches}
+    _match_rows(matcher, storage.iter_post_rows(after_post_id=after_post_id, up_to_post_id=up_to_post_id),
+                after_post_ids, matched_post_ids)
+    scores = {search.id: score_matches(storage, matched_post_ids[search.id], _keywords(search),
+                                       statistics=statistics[search.id]) for search in searches}
+    return matched_post_ids, scores
+
+
+def _shards(scan_from: int, up_to_post_id: int, count: int) -> list[tuple]:
+    width = -(-(up_to_post_id - scan_from) // count)
+    return [(start, min(start + width, up_to_post_id)) for start in range(scan_from, up_to_post_id, width)]
+
+
+def create_worker_pool(storage: DatabaseStorage, workers: int) -> ProcessPoolExecutor:
+    """
+    Start processes matching posts for run_all_searches, to reuse across runs
+
+    Each worker opens a read-only connection to the storage's database and keeps its
+    compiled matchers between runs, so a long-running caller only pays for starting
+    the processes once.
+
+    Args:
+        storage (DatabaseStorage): The storage whose database the workers read
+        workers (int): The number of processes
+
+    Returns:
+        ProcessPoolExecutor: The pool, for the caller to shut down when done
+    """
+    db_path = storage.engine.url.render_as_string(hide_password=False)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(WORKER_START_METHOD),
+                               initializer=_init_worker, initargs=(db_path,))
+
+
+def _match_in_workers(storage: DatabaseStorage, searches: list[SearchView], after_post_ids: dict, scan_from: int,
+                      up_to_post_id: int, workers: int, pool: ProcessPoolExecutor = None, progress=None):
+    """
+    Match and score the posts in (scan_from, up_to_post_id] across worker processes
+
+    The range is cut into SHARDS_PER_WORKER shards per worker; each worker reads its shards
+    through its own read-only connection and returns the matched IDs and their scores,
+    which are merged here in post ID order. Without a pool, one is started for the call.
+
+    Returns:
+        tuple: (matched post IDs, relevance scores), both dictionaries keyed by search ID
+    """
+    # Corpus statistics are global, so they are computed once here rather than per shard
+    statistics = {search.id: CorpusStatistics.load(storage, _keywords(search)) for search in searches}
+    shards = _shards(scan_from, up_to_post_id, workers * SHARDS_PER_WORKER)
+    results = {}
+    with ExitStack() as stack:
+        if pool is None:
+            pool = stack.enter_context(create_worker_pool(storage, workers))
+        futures = {pool.submit(_match_shard, searches, after_post_ids, statistics, *shard): shard for shard in shards}
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            if progress:
+                progress(0.9 * done / len(shards))
+
+    matched_post_ids = {search.id: [] for search in searches}
+    scores = {search.id: {} for search in searches}
+    for shard in sorted(results):
+        shard_matches, shard_scores = results[shard]
+        for search in searches:
+            matched_post_ids[search.id] += shard_matches[search.id]
+            scores[search.id].update(shard_scores[search.id])
+    return matched_post_ids, scores
+
+
+def _can_use_workers(storage: DatabaseStorage) -> bool:
+    # Every process opens its own connection, which an in-memory SQLite database cannot be shared through
+    url = storage.engine.url
+    return not (url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'))
+
+
+def match_posts(storage: DatabaseStorage, searches: list[SearchView], after_post_ids: dict, scan_from: int,
+                up_to_post_id: int, workers=1, pool: ProcessPoolExecutor = None, progress=None,
+                progress_every=POST_STREAM_BATCH_SIZE):
+    """
+    Match and score the posts in (scan_from, up_to_post_id] against many searches
+
+    Args:
+        storage (DatabaseStorage): The storage to read posts from
+        searches (list[SearchView]): The searches to match
+        after_post_ids (dict): The ID above which each search records posts, None for every post,
+            keyed by search ID
+        scan_from (int): Only read posts with an ID strictly greater than this one
+        up_to_post_id (int): Only read posts with an ID less than or equal to this one
+        workers (int): The number of processes matching posts, see run_all_searches
+        pool (ProcessPoolExecutor): Optional pool of workers to reuse, see create_worker_pool
+        progress (callable): Optional callback receiving the fraction of work done, from 0 to 0.9
+        progress_every (int): Report progress every this many posts, when matching in-process
+
+    Returns:
+        tuple: (matched post IDs in ID order, relevance scores), both dictionaries keyed by search ID
+    """
+    min_posts = PARALLEL_MIN_POSTS if pool is None else POOL_MIN_POSTS
+    if workers > 1 and up_to_post_id - scan_from >= min_posts and _can_use_workers(storage):
+        return _match_in_workers(storage, searches, after_post_ids, scan_from, up_to_post_id, workers, pool=pool,
+                                 progress=progress)
+
+    matcher = matcher_cache.get(searches)
+    matched_post_ids = {search.id: [] for search in searches}
+    rows = storage.iter_post_rows(after_post_id=scan_from, up_to_post_id=up_to_post_id)
+    if progress:
+        rows = _reporting_progress(rows, progress, progress_every, scan_from, up_to_post_id)
+    _match_rows(matcher, rows, after_post_ids, matched_post_ids)
+    scores = {search.id: score_matches(storage, matched_post_ids[search.id], _keywords(search)) for search in searches}
+    return matched_post_ids, scores
+
+
+def run_all_searches(storage: DatabaseStorage, searches=None, full_rebuild=False, progress=None,
+                     progress_every=POST_STREAM_BATCH_SIZE, notifier=None, in_database=False, workers=1, pool=None):
+    """
+    Evaluate many saved searches in one pass over the posts table
+
+    All search criteria are compiled into a MultiSearchMatcher and posts are streamed
+    once, starting from the lowest watermark among the searches. Each search only
+    records posts above its own watermark, and its matches are then written exactly as
+    run_search would (append for incremental runs, replace for first runs and rebuilds).
+    With in_database=True each search is instead run as its own INSERT ... SELECT, which
+    suits few searches over a large corpus better than streaming every post into Python.
+    With workers > 1 the posts are partitioned by ID range and matched and scored in that
+    many processes, each reading through its own read-only connection; the merged matches
+    of each search are then written in one transaction, as in a single-process run.
+    Callers running searches repeatedly should pass a pool from create_worker_pool, as
+    starting the processes costs about a second per worker.
+
+    Args:
+        storage (DatabaseStorage): The storage to read posts from and write matches to
+        searches (list[SearchView], optional): The searches to run. Defaults to all saved searches.
+        full_rebuild (bool): If True, ignore the watermarks and re-evaluate the whole corpus
+        progress (callable): Optional callback receiving the fraction of work done, from 0 to 1
+        progress_every (int): Report progress every this many posts
+        notifier (NotificationDispatcher): Optional dispatcher told about matches of new posts
+        in_database (bool): If True, run every search inside the database, see run_search
+        workers (int): The number of processes matching posts. Ranges of fewer than
+            PARALLEL_MIN_POSTS post IDs (POOL_MIN_POSTS with a pool), and in-memory SQLite
+            databases, are matched in-process.
+        pool (ProcessPoolExecutor): Optional started pool of the given number of workers,
+            reading the storage's database, see create_worker_pool
+
+    Returns:
+        dict: The number of matches written, keyed by search ID
+    """
+    if searches is None:
+        searches = storage.get_all_searches()
+    if not searches:
+        return {}
+
+    if in_database:
+        counts = {}
+        for done, search in enumerate(searches, 1):
+            counts[search.id] = run_search(storage, search, full_rebuild=full_rebuild, notifier=notifier,
+                                           in_database=True)
+            if progress:
+                progress(done / len(searches))
+        return counts
+
+    up_to_post_id = storage.get_max_post_id()
+    watermarks = {search.id: storage.get_watermark(search.id) for search in searches}
+    after_post_ids = {
+        search_id: watermark.last_post_id if watermark and not full_rebuild else None
+        for search_id, watermark in watermarks.items()
+    }
+    scan_from = min((after or 0) for after in after_post_ids.values())
+    matched_post_ids, scores = match_posts(storage, searches, after_post_ids, scan_from, up_to_post_id,
+                                           workers=workers, pool=pool, progress=progress,
+                                           progress_every=progress_every)
+
+    counts = {}
+    for search in searches:
+        counts[search.id] = _save_matches(
+            storage, search, matched_post_ids[search.id], watermarks[search.id],
+            replace=after_post_ids[search.id] is None, up_to_post_id=up_to_post_id, notifier=notifier,
+            scores=scores[search.id])
+    return counts
+
+
+def _reporting_progress(rows, progress, progress_every: int, scan_from: int, up_to_post_id: int):
+    for scanned, post in enumerate(rows, 1):
+        if scanned % progress_every == 0:
+            # Post ids are dense enough for the position in the id range to estimate progress
+            progress(0.9 * (post.id - scan_from) / max(up_to_post_id - scan_from, 1))
+        yield post
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the storage and matching hot paths.
+This script generates a synthetic corpus of posts and searches, then measures ingestion
+throughput, keyword and user matching latency, a full search pass (in Python, across
+worker processes and as INSERT ... SELECT statements), save_matches and paginated reads. Results are written as JSON so that runs can be compared with --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlalchemy
+
+from modules.ingestion import ingest_records, DEFAULT_BATCH_SIZE
+from modules.search_runner import run_all_searches, match_posts, create_worker_pool
+from modules.storage import DatabaseStorage
+
+VOCABULARY = [
+    "hiring", "remote", "python", "engineer", "product", "launch", "growth", "startup",
+    "leadership", "marketing", "sales", "data", "cloud", "security", "design", "career",
+    "team", "culture", "funding", "customer", "strategy", "innovation", "community", "event",
+]
+RARE_KEYWORDS = ["kubernetes", "quantum", "biotech", "compliance", "robotics", "climate"]
+
+BENCHMARKS = ["ingest", "keyword_match", "user_match", "search_pass", "search_pass_parallel", "search_pass_sql",
+              "save_matches", "pagination"]
+
+# Metrics where a higher value is better, every other metric is a duration
+THROUGHPUT_METRICS = ("rows_per_second",)
+
+# Metrics checked for regressions by --compare; min/p95/max of a few runs are too noisy
+COMPARED_METRICS = ("median", "seconds") + THROUGHPUT_METRICS
+
+# Durations below this many seconds in both runs are reported but never flagged as regressions
+NOISE_FLOOR = 0.002
+
+
+def generate_records(post_count: int, user_count: int, seed: int):
+    """
+    Yield synthetic scraped post records in the scraper export format, in constant memory
+    """
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    for i in range(post_count):
+        words = rng.choices(VOCABULARY, k=30)
+        if rng.random() < 0.002:
+            words.insert(rng.randrange(len(words)), rng.choice(RARE_KEYWORDS))
+        user = rng.randrange(user_count)
+        yield {
+            "url": f"https://www.linkedin.com/posts/synthetic-{i}",
+            "user_id": f"user{user}",
+            "use_url": f"https://www.linkedin.com/in/user{user}",
+            "post_text": " ".join(words),
+            "date_posted": start + timedelta(minutes=i),
+            "num_likes": rng.randrange(500),
+            "num_comments": rng.randrange(50),
+            "num_shares": rng.randrange(20),
+        }
+
+
+def generate_searches(storage: DatabaseStorage, search_count: int, user_count: int, seed: int):
+    """
+    Save a mix of keyword searches (common and rare terms) and user searches
+    """
+    rng = random.Random(seed)
+    for i in range(search_count):
+        if i % 3 == 2:
+            usernames = ", ".join(f"user{rng.randrange(user_count)}" for _ in range(rng.randint(1, 5)))
+            storage.save_search({"name": f"Users {i}", "type": "user", "usernames": usernames})
+        else:
+            pool = RARE_KEYWORDS if i % 3 == 1 else VOCABULARY
+            keywords = ", ".join(rng.sample(pool, rng.randint(1, 3)))
+            storage.save_search({"name": f"Topic {i}", "type": "topic", "keywords": keywords})
+
+
+def summarize(samples: list[float]) -> dict:
+    """
+    Reduce a list of durations in seconds to the statistics reported for a benchmark
+    """
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))],
+        "max": ordered[-1],
+    }
+
+
+def measure(function, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def bench_ingest(storage, args):
+    records = generate_records(args.posts, args.users, args.seed)
+    stats = ingest_records(storage, records, batch_size=args.batch_size, log_every=0)
+    return {"rows": stats.rows, "seconds": stats.seconds, "rows_per_second": stats.rows_per_second}
+
+
+def bench_keyword_match(storage, args):
+    searches = [s for s in storage.get_all_searches() if s.type != "user"]
+    results = {}
+    for use_fts in ([True, False] if storage.has_fts else [False]):
+        samples, matches = [], 0
+        for search in searches:
+            keywords = list(search.terms)
+            timing = measure(lambda: storage.get_post_ids_by_keywords(keywords, use_fts=use_fts), args.repeat)
+            samples.append(timing["median"])
+            matches += len(storage.get_post_ids_by_keywords(keywords, use_fts=use_fts))
+        results["fts" if use_fts else "like"] = {**summarize(samples), "searches": len(searches), "matches": matches}
+    return results
+
+
+def bench_user_match(storage, args):
+    searches = [s for s in storage.get_all_searches() if s.type == "user"]
+    samples, matches = [], 0
+    for search in searches:
+        samples.append(measure(lambda: storage.get_post_ids_by_search_users(search.id), args.repeat)["median"])
+        matches += len(storage.get_post_ids_by_search_users(search.id))
+    return {**summarize(samples), "searches": len(searches), "matches": matches}
+
+
+def bench_search_pass(storage, args):
+    started = time.perf_counter()
+    counts = run_all_searches(storage, full_rebuild=True)
+    return {"seconds": time.perf_counter() - started, "searches": len(counts), "matches": sum(counts.values())}
+
+
+def bench_search_pass_parallel(storage, args):
+    # Worker counts 1, 2, 4, ... up to --workers, each with a pool started once and reused, as the monitor does.
+    # The match phase is timed apart from the serial writes, and startup_seconds is the cost of the first pass
+    # over a warm one; ranges under POOL_MIN_POSTS posts are matched in-process whatever the worker count.
+    searches = storage.get_all_searches()
+    up_to_post_id = storage.get_max_post_id()
+    after_post_ids = {search.id: None for search in searches}
+    counts = [1]
+    while counts[-1] * 2 < args.workers:
+        counts.append(counts[-1] * 2)
+    if args.workers > 1:
+        counts.append(args.workers)
+
+    results = {}
+    for workers in counts:
+        pool = create_worker_pool(storage, workers) if workers > 1 else None
+        try:
+            started = time.perf_counter()
+            match_posts(storage, searches, after_post_ids, 0, up_to_post_id, workers=workers, pool=pool)
+            cold_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            match_posts(storage, searches, after_post_ids, 0, up_to_post_id, workers=workers, pool=pool)
+            match_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            matches = sum(run_all_searches(storage, searches, full_rebuild=True, workers=workers, pool=pool).values())
+            seconds = time.perf_counter() - started
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        baseline = results.get("workers_1", {"seconds": seconds, "match_seconds": match_seconds})
+        results[f"workers_{workers}"] = {
+            "seconds": seconds, "match_seconds": match_seconds, "startup_seconds": max(cold_seconds - match_seconds, 0),
+            "matches": matches, "speedup": baseline["seconds"] / seconds,
+            "match_speedup": baseline["match_seconds"] / match_seconds,
+        }
+    return results
+
+
+def bench_search_pass_sql(storage, args):
+    started = time.perf_counter()
+    counts = run_all_searches(storage, full_rebuild=True, in_database=True)
+    return {"seconds": time.perf_counter() - started, "searches": len(counts), "matches": sum(counts.values())}
+
+
+def bench_save_matches(storage, args):
+    search_id = storage.save_search({"name": "save_matches benchmark", "type": "topic", "keywords": "hiring"})
+    post_ids = storage.get_post_ids_by_keywords(["hiring"])
+    matches = [{"post_id": post_id} for post_id in post_ids]
+    timing = measure(lambda: storage.save_matches(search_id, matches, replace=True), args.repeat)
+    storage.delete_matches(search_id)
+    storage.delete_search(search_id)
+    return {**timing, "rows": len(matches), "rows_per_second": len(matches) / timing["median"] if matches else 0.0}
+
+
+def bench_pagination(storage, args):
+    per_page = 20
+    results = {"posts_first_page": measure(lambda: storage.get_posts_page(per_page=per_page), args.repeat)}
+
+    # Walk a number of pages with cursors and time the deepest one against an OFFSET query of the same depth
+    depth = min(args.page_depth, max(args.posts // per_page - 1, 1))
+    cursor = None
+    for _ in range(depth):
+        _, cursor, _ = storage.get_posts_page(cursor=cursor, per_page=per_page)
+    results["posts_keyset_deep_page"] = {**measure(lambda: storage.get_posts_page(cursor=cursor, per_page=per_page),
+                                                   args.repeat), "page": depth + 1}
+    results["posts_offset_deep_page"] = {**measure(lambda: storage.get_posts(page=depth + 1, per_page=per_page),
+                                                   args.repeat), "page": depth + 1}
+
+    searches = storage.get_all_searches()
+    if searches:
+        search_id = max(searches, key=lambda s: storage.count_matches(s.id)).id
+        results["matches_first_page"] = measure(lambda: storage.get_matches_page(search_id, per_page=per_page),
+                                                args.repeat)
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlalchemy": sqlalchemy.__version__,
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+    }
+
+
+def flatten(results: dict, prefix=""):
+    """
+    Yield (path, value) for every numeric leaf of nested results, e.g. ("keyword_match.fts.median", 0.01)
+    """
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, f"{path}.")
+        elif isinstance(value, (int, float)):
+            yield path, value
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> int:
+    """
+    Print the change of every timing and throughput metric against a baseline run
+
+    Returns:
+        int: The number of metrics that regressed by more than threshold
+    """
+    before = dict(flatten(baseline["results"]))
+    regressions = 0
+    print(f"\n{'metric':<48}{'baseline':>12}{'current':>12}{'change':>10}")
+    for path, value in flatten(current["results"]):
+        name = path.rsplit(".", 1)[-1]
+        if path not in before or name not in COMPARED_METRICS:
+            continue
+        old = before[path]
+        if not old:
+            continue
+        change = value / old - 1
+        worse = -change if name in THROUGHPUT_METRICS else change
+        noise = name not in THROUGHPUT_METRICS and max(old, value) < NOISE_FLOOR
+        flag = ""
+        if worse > threshold and not noise:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{path:<48}{old:>12.4f}{value:>12.4f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--posts", type=int, default=10_000, help="number of synthetic posts (10k to 5M)")
+    parser.add_argument("--searches", type=int, default=30, help="number of synthetic searches")
+    parser.add_argument("--users", type=int, default=5_000, help="number of distinct post authors")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per timed operation")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="posts per ingestion transaction")
+    parser.add_argument("--page-depth", type=int, default=500, help="page number used for the deep pagination reads")
+    parser.add_argument("--seed", type=int, default=42, help="random seed of the synthetic corpus")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="largest number of worker processes timed by search_pass_parallel")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="run only these benchmarks")
+    parser.add_argument("--db", help="database file to use instead of a temporary one (kept afterwards)")
+    parser.add_argument("--output", help="file to write the JSON results to (default: stdout)")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown reported as a regression by --compare")
+    args = parser.parse_args()
+
+    selected = args.only or BENCHMARKS
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.db or os.path.join(directory, "benchmark.db")
+        storage = DatabaseStorage(f"sqlite:///{path}")
+
+        results = {}
+        if "ingest" in selected or not storage.count_posts():
+            print(f"Ingesting {args.posts} posts...", file=sys.stderr)
+            results["ingest"] = bench_ingest(storage, args)
+        if not storage.get_all_searches():
+            generate_searches(storage, args.searches, args.users, args.seed)
+
+        for name in selected:
+            if name == "ingest":
+                continue
+            print(f"Running {name}...", file=sys.stderr)
+            results[name] = globals()[f"bench_{name}"](storage, args)
+        storage.engine.dispose()
+
+    report = {"environment": environment(), "parameters": vars(args), "results": results}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        print(f"\n{regressions} regressions above {args.threshold:.0%}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
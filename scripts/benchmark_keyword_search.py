@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark script for keyword searches.
+This script builds a synthetic corpus of posts and compares the FTS5 index path of
+DatabaseStorage.get_post_ids_by_keywords against the ilike table scan.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+
+from database.Models import Post
+from modules.storage import DatabaseStorage
+
+VOCABULARY = [
+    "hiring", "remote", "python", "engineer", "product", "launch", "growth", "startup",
+    "leadership", "marketing", "sales", "data", "cloud", "security", "design", "career",
+    "team", "culture", "funding", "customer", "strategy", "innovation", "community", "event",
+]
+RARE_KEYWORDS = ["kubernetes", "quantum", "biotech"]
+
+
+def populate(storage: DatabaseStorage, post_count: int, batch_size=50_000):
+    """
+    Fill the posts table with synthetic content in large executemany batches
+    """
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    with storage.engine.begin() as connection:
+        for offset in range(0, post_count, batch_size):
+            rows = []
+            for i in range(offset, min(offset + batch_size, post_count)):
+                words = rng.choices(VOCABULARY, k=30)
+                if rng.random() < 0.001:
+                    words.append(rng.choice(RARE_KEYWORDS))
+                rows.append({
+                    "post_url": f"https://www.linkedin.com/posts/synthetic-{i}",
+                    "user_name": f"user{rng.randrange(10_000)}",
+                    "user_url": None,
+                    "content": " ".join(words),
+                    "timestamp": start + timedelta(minutes=i),
+                    "likes": 0,
+                    "comments": 0,
+                    "shares": 0,
+                })
+            connection.execute(insert(Post), rows)
+
+
+def timed(storage: DatabaseStorage, keywords: list[str], use_fts: bool, repeat: int):
+    best = None
+    result = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = storage.get_post_ids_by_keywords(keywords, use_fts=use_fts)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--posts", type=int, default=1_000_000, help="number of synthetic posts")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per query, best time is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        storage = DatabaseStorage(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        if not storage.has_fts:
+            print("FTS5 with the trigram tokenizer is not available in this SQLite build")
+            return
+
+        print(f"Generating {args.posts} posts...")
+        started = time.perf_counter()
+        populate(storage, args.posts)
+        print(f"Generated in {time.perf_counter() - started:.1f}s")
+
+        queries = [["kubernetes"], ["quantum", "biotech"], ["hiring"], ["hiring", "remote", "python"]]
+        print(f"\n{'keywords':<32}{'matches':>10}{'like (s)':>12}{'fts (s)':>12}{'speedup':>10}")
+        for keywords in queries:
+            like_time, like_count = timed(storage, keywords, use_fts=False, repeat=args.repeat)
+            fts_time, fts_count = timed(storage, keywords, use_fts=True, repeat=args.repeat)
+            assert like_count == fts_count, f"result mismatch for {keywords}: {like_count} != {fts_count}"
+            print(f"{','.join(keywords):<32}{fts_count:>10}{like_time:>12.3f}{fts_time:>12.3f}{like_time / fts_time:>9.1f}x")
+
+        storage.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,46 @@
 #!/usr/bin/env python3
 """
-Test script for the database schema.
-This script creates the database tables, inserts some sample data, and performs basic queries.
+Load scraped LinkedIn posts into the database.
+The export (a JSON array or JSON Lines file) is streamed in constant memory and upserted in
+batches, so posts that already exist get their likes/comments/shares refreshed.
 """
-import json
-import sys
+import argparse
+import logging
 import os
-
-from database.Models import Post
+import sys
 
 # Add the parent directory to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from datetime import datetime
-from database.database import setup_database
+from database.database import database_url_from_env
+from modules.dedup import DuplicateFilter, MARK, SKIP
+from modules.ingestion import ingest_file, DEFAULT_BATCH_SIZE
+from modules.storage import DatabaseStorage
 
 
 def main():
-    # Set up the database
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", nargs="?", default="../data/linkedin_posts.json", help="JSON or JSONL export file")
+    parser.add_argument("--db", default=database_url_from_env(),
+                        help="database connection string, selecting the backend (default: $DATABASE_URL or SQLite)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="posts per transaction")
+    parser.add_argument("--dedupe", choices=[MARK, SKIP],
+                        help="detect near-duplicate posts and mark them (linked to the original) or skip them")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
     print("Setting up the database...")
-    engine, Session = setup_database()
-    session = Session()
-
-    # Read json
-    with open('../data/linkedin_posts.json') as f:
-        posts = json.load(f)
-
-    try:
-        for post in posts:
-            post_obj = Post(
-                post_url=post['url'],
-                user_name=post['user_id'],
-                user_url=post['use_url'],
-                content=post['post_text'],
-                timestamp=datetime.fromisoformat(post['date_posted']),
-                likes=post['num_likes'],
-                comments=post['num_comments'],
-                shares=0
-            )
-            session.add(post_obj)
-            session.commit()
-            print(f"Created posts: {post_obj}")
-
-    except Exception as e:
-        print(f"Error: {e}")
-        session.rollback()
-    finally:
-        session.close()
+    storage = DatabaseStorage(args.db)
+
+    duplicate_filter = DuplicateFilter(storage, mode=args.dedupe) if args.dedupe else None
+    if duplicate_filter is not None:
+        print(f"Signed {duplicate_filter.backfill()} previously loaded posts")
+
+    print(f"Loading posts from {args.path}...")
+    stats = ingest_file(storage, args.path, batch_size=args.batch_size, duplicate_filter=duplicate_filter)
+    print(f"Loaded {stats}")
+
 
 if __name__ == "__main__":
     main()
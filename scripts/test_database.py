@@ -7,7 +7,7 @@ This script creates the database tables, inserts some sample data, and performs
 import sys
 import os
 
-from database.Models import Match, Search, Post
+from database.Models import Match, Search, SearchTerm, SearchUser, Post
 
 # Add the parent directory to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -57,7 +57,7 @@ def main():
             id=1,
             name="User Posts",
             type="user",
-            keyword="john_doe",
+            users=[SearchUser(position=0, user_name="john_doe")],
             notify=True
         )
 
@@ -65,7 +65,7 @@ def main():
             id=2,
             name="Tech Topics",
             type="topic",
-            keyword="AI,SEO,joy,Positive,remote",
+            terms=[SearchTerm(position=i, term=term) for i, term in enumerate(["AI", "SEO", "joy", "Positive", "remote"])],
             notify=True
         )
 
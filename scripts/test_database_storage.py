@@ -40,7 +40,7 @@ def main():
         print(f"Search ID: {search.id}")
         print(f"Name: {search.name}")
         print(f"Type: {search.type}")
-        print(f"Keyword: {search.keyword}")
+        print(f"Keyword: {search.keywords}")
         print(f"Notify: {search.notify}")
     else:
         print("Search not found!")
@@ -63,7 +63,7 @@ def main():
         print(f"Search ID: {updated_search.id}")
         print(f"Name: {updated_search.name}")
         print(f"Type: {updated_search.type}")
-        print(f"Keyword: {updated_search.keyword}")
+        print(f"Keyword: {updated_search.keywords}")
         print(f"Notify: {updated_search.notify}")
     else:
         print("Updated search not found!")
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Test script for the monitor.
+This script feeds scraped records from a fake scraper to a Monitor, runs short passes offline and
+checks that ingestion goes through the near-duplicate filter and that only new matches are announced.
+Set TEST_DATABASE_URL to run it against another backend than a temporary SQLite file.
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.Models import Post
+from modules.dedup import DuplicateFilter, SKIP
+from modules.monitor import Monitor, PostSource
+from modules.storage import DatabaseStorage
+from test_query_counts import drop_tables
+
+# Long enough for a changed punctuation mark to leave the SimHash of a post unchanged
+HIRING = "We are hiring a senior Python engineer to build our data platform, remote friendly, apply today"
+
+
+class FakeScraper(PostSource):
+    # Returns one batch of records per fetch, as a scraper polling the feed would
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+
+    def fetch(self):
+        return self.batches.pop(0) if self.batches else []
+
+
+class RecordingNotifier:
+    # Stands in for a NotificationDispatcher
+
+    def __init__(self):
+        self.notified = []
+
+    def notify(self, search, post_ids):
+        self.notified.append((search.name, sorted(post_ids)))
+
+
+def record(number: int, text: str):
+    # In the scraper export format, see modules.ingestion.post_from_record
+    return {
+        'url': f"https://www.linkedin.com/posts/monitor-{number}/",
+        'user_id': f"user{number % 3}",
+        'use_url': f"https://www.linkedin.com/in/user{number % 3}/",
+        'post_text': text,
+        'date_posted': (datetime(2024, 1, 1) + timedelta(hours=number)).isoformat(),
+        'num_likes': number,
+    }
+
+
+def post_urls(storage):
+    session = storage.Session()
+    try:
+        return sorted(post_url for post_url, in session.query(Post.post_url))
+    finally:
+        session.close()
+
+
+def check_duplicate_filter(storage):
+    # Near-duplicates are dropped within a batch and against the posts of earlier polls
+    scraper = FakeScraper([
+        [record(0, HIRING + '.'), record(1, HIRING + '!'), record(2, 'Rust meetup in Berlin next week')],
+        [record(3, HIRING + '?'), record(4, 'Cloud cost tips for startups')],
+    ])
+    monitor = Monitor(storage, scraper, duplicate_filter=DuplicateFilter(storage, mode=SKIP))
+    first, second = monitor.ingest(), monitor.ingest()
+    monitor.stop()
+    return [
+        (first.rows, first.duplicates) == (2, 1),
+        (second.rows, second.duplicates) == (1, 1),
+        post_urls(storage) == sorted(record(number, '')['url'] for number in (0, 2, 4)),
+    ]
+
+
+def check_pass(storage):
+    # The first pass backfills silently; the next one announces the matches of newly scraped posts only,
+    # for the searches with notifications on
+    scraper = FakeScraper([
+        [record(0, HIRING), record(1, 'Rust meetup in Berlin next week')],
+        [record(2, HIRING + '!'), record(3, 'Hiring Rust developers for our cloud team')],
+    ])
+    hiring_id = storage.save_search({'name': 'Hiring', 'type': 'topic', 'keywords': 'hiring', 'notify': True})
+    storage.save_search({'name': 'Rust', 'type': 'topic', 'keywords': 'rust', 'notify': False})
+    notifier = RecordingNotifier()
+    monitor = Monitor(storage, scraper, notifier=notifier, duplicate_filter=DuplicateFilter(storage, mode=SKIP))
+    first = monitor.run_once()
+    second = monitor.run_once()
+    monitor.stop()
+    return [
+        sorted(first.values()) == [1, 1],
+        sorted(second.values()) == [1, 1],
+        notifier.notified == [('Hiring', [3])],
+        sorted(storage.get_matched_post_ids(hiring_id)) == [1, 3],
+    ]
+
+
+CHECKS = {
+    'duplicate filter': check_duplicate_filter,
+    'pass over new posts': check_pass,
+}
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    # Set TEST_DATABASE_URL to run against another backend, e.g. a throwaway local PostgreSQL,
+    # whose tables are dropped after each check
+    database_url = os.environ.get('TEST_DATABASE_URL')
+
+    failures = 0
+    for number, (name, check) in enumerate(CHECKS.items()):
+        storage = DatabaseStorage(database_url or f"sqlite:///{os.path.join(directory, f'monitor_{number}.db')}")
+        try:
+            results = check(storage)
+        finally:
+            if database_url:
+                drop_tables(storage.engine)
+            storage.engine.dispose()
+        status = 'OK' if all(results) else 'FAIL'
+        failures += status == 'FAIL'
+        print(f"{status:4} {name} {'' if status == 'OK' else results}")
+
+    if failures:
+        print(f"\n{failures} checks failed")
+        sys.exit(1)
+    print("\nAll monitor checks passed")
+
+
+if __name__ == "__main__":
+    main()
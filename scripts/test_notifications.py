@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Test script for match notifications.
+This script starts a local HTTP receiver and a minimal SMTP server, pushes bursts of matches
+through a NotificationDispatcher and checks digest batching, retries with backoff on failing
+receivers, and that notify() never blocks when the queues are full.
+"""
+
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.notifications import NotificationDispatcher, WebhookSender, SMTPSender
+from modules.storage import DatabaseStorage
+
+# Requests answered with a 500 by /flaky before it accepts one
+FLAKY_FAILURES = 2
+
+# Seconds /slow takes to answer, to keep the sender queues full
+SLOW_SECONDS = 0.3
+
+# Fast delivery settings, so retries and flushes happen within the test
+TEST_SETTINGS = dict(flush_interval=0.5, backoff=0.05, rate=1000, burst=1000)
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    # /ok accepts every digest, /flaky fails FLAKY_FAILURES times first, /down always fails, /slow is slow
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.server.lock:
+            requests = self.server.requests.setdefault(self.path, [])
+            requests.append((time.monotonic(), body))
+            attempt = len(requests)
+        if self.path == '/slow':
+            time.sleep(SLOW_SECONDS)
+        failing = self.path == '/down' or (self.path == '/flaky' and attempt <= FLAKY_FAILURES)
+        self.send_response(500 if failing else 200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    # Just enough of SMTP for smtplib.send_message: every command is accepted and DATA is recorded
+
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.reply('220 localhost test server')
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line.split(' ', 1)[0].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+            if command == 'DATA':
+                self.reply('354 end data with <CR><LF>.<CR><LF>')
+                data = []
+                while (data_line := self.rfile.readline().decode()) not in ('.\r\n', ''):
+                    data.append(data_line)
+                with self.server.lock:
+                    self.server.messages.append(''.join(data))
+            self.reply('250 ok')
+
+
+def start_servers():
+    http = ThreadingHTTPServer(('127.0.0.1', 0), WebhookHandler)
+    http.requests, http.lock = {}, threading.Lock()
+    smtp = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPHandler)
+    smtp.messages, smtp.lock = [], threading.Lock()
+    for server in (http, smtp):
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return http, smtp
+
+
+def populate(storage, count=200):
+    now = datetime.now()
+    storage.upsert_posts([{
+        'post_url': f"https://www.linkedin.com/posts/notify-{i}/",
+        'user_name': f"User {i % 5}",
+        'user_url': f"https://www.linkedin.com/in/user-{i % 5}/",
+        'content': f"Post {i} about hiring",
+        'timestamp': now - timedelta(minutes=i),
+    } for i in range(count)])
+    searches = [storage.get_search(storage.save_search({'name': name, 'type': 'topic', 'keywords': 'hiring',
+                                                         'notify': True}))
+                for name in ('Alpha', 'Beta')]
+    return searches, storage.get_post_ids_by_keywords(['hiring'])
+
+
+def webhook(http, path):
+    return WebhookSender(f"http://127.0.0.1:{http.server_address[1]}{path}", timeout=5.0)
+
+
+def check_digest_batching(storage, http, smtp, searches, post_ids):
+    # A burst of single matches is delivered as one digest per search and sender, and a large batch
+    # as one digest listing at most digest_size matches
+    alpha, beta = searches
+    sender = SMTPSender('127.0.0.1', smtp.server_address[1], 'monitor@localhost', ['team@localhost'])
+    dispatcher = NotificationDispatcher(storage, [webhook(http, '/ok'), sender], digest_size=20, **TEST_SETTINGS)
+    for post_id in post_ids[:15]:
+        dispatcher.notify(alpha, [post_id])
+    dispatcher.notify(beta, post_ids[15:60])
+    dispatcher.close()
+
+    digests = {digest['search_id']: digest for _, digest in http.requests.get('/ok', [])}
+    return [
+        len(http.requests.get('/ok', [])) == 2,
+        {search_id: digest['total_matches'] for search_id, digest in digests.items()} == {alpha.id: 15, beta.id: 45},
+        [len(digests[search.id]['matches']) for search in searches] == [15, 20],
+        len(smtp.messages) == 2,
+        any("15 new matches for 'Alpha'" in message for message in smtp.messages),
+        dispatcher.stats['delivered'] == 4,
+    ]
+
+
+def check_retries(storage, http, smtp, searches, post_ids):
+    # A failing receiver is retried with growing delays; one that keeps failing is given up on
+    alpha, _ = searches
+    dispatcher = NotificationDispatcher(storage, [webhook(http, '/flaky'), webhook(http, '/down')], max_attempts=3,
+                                        **TEST_SETTINGS)
+    dispatcher.notify(alpha, post_ids[:5])
+    dispatcher.close()
+
+    flaky = [at for at, _ in http.requests.get('/flaky', [])]
+    down = http.requests.get('/down', [])
+    # Each retry waits backoff * 2 ** (attempt - 1), jittered between half and one and a half times that
+    delays = [later - earlier for earlier, later in zip(flaky, flaky[1:])]
+    return [
+        len(flaky) == FLAKY_FAILURES + 1,
+        all(delay >= TEST_SETTINGS['backoff'] * 2 ** attempt * 0.5 for attempt, delay in enumerate(delays)),
+        len(down) == 3,
+        dispatcher.stats['delivered'] == 1,
+        dispatcher.stats['failed'] == 1,
+        dispatcher.stats['retries'] == FLAKY_FAILURES + 2,
+    ]
+
+
+def check_full_queues(storage, http, smtp, searches, post_ids):
+    # With a slow receiver and tiny queues, notify() returns at once and the overflow is dropped and counted
+    alpha, beta = searches
+    dispatcher = NotificationDispatcher(storage, [webhook(http, '/slow')], queue_size=2, digest_size=1,
+                                        **TEST_SETTINGS)
+    started = time.perf_counter()
+    for number, post_id in enumerate(post_ids):
+        dispatcher.notify(alpha if number % 2 else beta, [post_id])
+    elapsed = time.perf_counter() - started
+    dispatcher.close()
+
+    stats = dispatcher.stats
+    return [
+        elapsed < SLOW_SECONDS,
+        stats['events'] == len(post_ids),
+        stats['dropped_events'] + stats['dropped_digests'] > 0,
+        stats['delivered'] == len(http.requests.get('/slow', [])),
+    ]
+
+
+def check_concurrent_start(storage, http, smtp, searches, post_ids):
+    # Threads notifying at once start a single loop, and every match reaches it
+    alpha, _ = searches
+    dispatcher = NotificationDispatcher(storage, [webhook(http, '/ok')], **TEST_SETTINGS)
+    barrier = threading.Barrier(8)
+    loops = []
+
+    def notify(post_id):
+        barrier.wait()
+        dispatcher.notify(alpha, [post_id])
+        loops.append(dispatcher._loop)
+
+    threads = [threading.Thread(target=notify, args=(post_id,)) for post_id in post_ids[:8]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    dispatcher.close()
+
+    return [
+        len(set(loops)) == 1,
+        dispatcher.stats['events'] == 8,
+        [digest['total_matches'] for _, digest in http.requests.get('/ok', [])] == [8],
+    ]
+
+
+class FailingStorage:
+    # Fails the lookups of some posts, as a dropped database connection would
+
+    def __init__(self, storage, failing_post_ids):
+        self.storage = storage
+        self.failing_post_ids = set(failing_post_ids)
+
+    def get_posts_by_ids(self, post_ids):
+        if self.failing_post_ids.intersection(post_ids):
+            raise RuntimeError('connection lost')
+        return self.storage.get_posts_by_ids(post_ids)
+
+
+def check_failed_lookup(storage, http, smtp, searches, post_ids):
+    # A digest whose posts cannot be looked up is counted as failed; the others are still delivered
+    # and close() returns
+    alpha, beta = searches
+    dispatcher = NotificationDispatcher(FailingStorage(storage, post_ids[:5]), [webhook(http, '/ok')], **TEST_SETTINGS)
+    dispatcher.notify(alpha, post_ids[:5])
+    dispatcher.notify(beta, post_ids[5:10])
+    dispatcher.close(timeout=5.0)
+
+    return [
+        [digest['search_id'] for _, digest in http.requests.get('/ok', [])] == [beta.id],
+        dispatcher.stats['failed'] == 1,
+        dispatcher.stats['delivered'] == 1,
+    ]
+
+
+CHECKS = {
+    'digest batching': check_digest_batching,
+    'retries with backoff': check_retries,
+    'notify with full queues': check_full_queues,
+    'concurrent start': check_concurrent_start,
+    'failed lookup': check_failed_lookup,
+}
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    storage = DatabaseStorage(f"sqlite:///{os.path.join(directory, 'notifications.db')}")
+    searches, post_ids = populate(storage)
+    http, smtp = start_servers()
+
+    failures = 0
+    for name, check in CHECKS.items():
+        http.requests.clear()
+        smtp.messages.clear()
+        results = check(storage, http, smtp, searches, post_ids)
+        status = 'OK' if all(results) else 'FAIL'
+        failures += status == 'FAIL'
+        print(f"{status:4} {name} {'' if status == 'OK' else results}")
+
+    http.shutdown()
+    smtp.shutdown()
+    if failures:
+        print(f"\n{failures} checks failed")
+        sys.exit(1)
+    print("\nAll notification checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test script for the async ingestion-to-matching pipeline.
+This script pipes synthetic records through run_pipeline on an async engine, then checks that
+the incremental matches it wrote are those of a sequential full rebuild of the same searches.
+Needs the async extra (pip install '.[async]'), i.e. greenlet and the async driver of the
+database; without them the checks are skipped with a message. Set TEST_DATABASE_URL to run it
+against another backend than a temporary SQLite file.
+"""
+
+import asyncio
+import importlib.util
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.engine import make_url
+
+# SQLAlchemy's asyncio extension cannot even be imported without greenlet
+if importlib.util.find_spec('greenlet') is None:
+    print("Skipping the pipeline checks: greenlet is not installed (pip install '.[async]')")
+    sys.exit(0)
+
+from modules.async_storage import AsyncDatabaseStorage, async_database_url
+from modules.pipeline import run_pipeline
+from modules.search_runner import run_all_searches
+from modules.storage import DatabaseStorage
+from test_query_counts import drop_tables
+
+WORDS = ["hiring", "python", "remote", "rust", "startup", "cloud", "design", "sales"]
+
+# Records piped through the pipeline, in batches small enough to queue up behind the matching
+RECORD_COUNT = 2000
+BATCH_SIZE = 100
+
+
+async def generate_records(count: int):
+    # An async source, as a scraper would be; the sleep hands the loop over to the matching
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        if i % BATCH_SIZE == 0:
+            await asyncio.sleep(0)
+        yield {
+            "url": f"https://www.linkedin.com/posts/pipeline-{i}",
+            "user_id": f"user{i % 7}",
+            "use_url": f"https://www.linkedin.com/in/user{i % 7}",
+            "post_text": " ".join(WORDS[(i * k) % len(WORDS)] for k in (1, 3, 5)),
+            "date_posted": start + timedelta(minutes=i),
+            "num_likes": i % 50,
+            "num_comments": i % 5,
+            "num_shares": i % 3,
+        }
+
+
+def save_searches(storage: DatabaseStorage):
+    storage.save_search({'name': 'Hiring', 'type': 'topic', 'keywords': 'hiring, remote', 'notify': False})
+    storage.save_search({'name': 'Rust', 'type': 'job', 'keywords': 'rust', 'notify': False})
+    storage.save_search({'name': 'Authors', 'type': 'user', 'usernames': 'user1, user4', 'notify': False})
+
+
+def stored_matches(storage: DatabaseStorage):
+    # Relevance is left out: it is scored against the corpus as it was when each match was written
+    return {search.id: sorted(match.post_id for match in storage.iter_matches(search.id))
+            for search in storage.get_all_searches()}
+
+
+async def run(database_url: str):
+    async with AsyncDatabaseStorage(database_url) as storage:
+        stats = await run_pipeline(storage, generate_records(RECORD_COUNT), batch_size=BATCH_SIZE, queue_size=2)
+        posts = await storage.count_posts()
+        page, _, _ = await storage.get_matches_page(1, per_page=5)
+    return stats, posts, page
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    # Set TEST_DATABASE_URL to run against another backend, e.g. a throwaway local PostgreSQL,
+    # whose tables are dropped afterwards
+    database_url = os.environ.get('TEST_DATABASE_URL') or f"sqlite:///{os.path.join(directory, 'pipeline.db')}"
+    driver = make_url(async_database_url(database_url)).get_driver_name().removesuffix('_async')
+    if importlib.util.find_spec(driver) is None:
+        print(f"Skipping the pipeline checks: the async driver {driver} is not installed")
+        return
+    storage = DatabaseStorage(database_url)
+    save_searches(storage)
+    stats, posts, page = asyncio.run(run(database_url))
+    print(f"Pipeline: {stats}")
+
+    incremental = stored_matches(storage)
+    run_all_searches(storage, full_rebuild=True)
+    rebuilt = stored_matches(storage)
+    if os.environ.get('TEST_DATABASE_URL'):
+        drop_tables(storage.engine)
+    storage.engine.dispose()
+
+    checks = {
+        'every record ingested': stats.ingestion.rows == posts == RECORD_COUNT,
+        'batches matched incrementally': 0 < stats.search_passes <= stats.ingestion.batches,
+        'match count reported': stats.matches == sum(len(matches) for matches in rebuilt.values()),
+        'matches equal a full rebuild': incremental == rebuilt and all(rebuilt.values()),
+        'pages read asynchronously': len(page) == 5,
+    }
+    for name, passed in checks.items():
+        print(f"{'OK' if passed else 'FAIL':4} {name}")
+    failures = sum(not passed for passed in checks.values())
+    if failures:
+        print(f"\n{failures} checks failed")
+        sys.exit(1)
+    print("\nAll pipeline checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test script for the number of SQL statements issued per page.
+This script fills a temporary database, renders every page of the web interface and checks
+that each one runs a fixed number of statements, whatever the number of rows shown.
+Set TEST_DATABASE_URL to run it against another backend than a temporary SQLite file.
+"""
+
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, text
+
+from database.database import Base, SCHEMA_MIGRATIONS_TABLE, POST_SEARCH_INDEX
+from modules.storage import DatabaseStorage
+
+# Statements each page may run: the page query, the search lookup and its criteria, the total count and the
+# statistics rollups it shows
+EXPECTED_QUERIES = {
+    '/': 3,
+    '/search': 2,
+    '/edit_search/1': 2,
+    '/posts?per_page=10': 2,
+    '/posts?per_page=20': 2,
+    '/view_matches/1?per_page=10': 6,
+    '/view_matches/1?per_page=20': 6,
+    '/view_matches/1?sort=relevance': 6,
+}
+
+# Pages for unknown searches, which redirect to the index after the search lookup
+EXPECTED_REDIRECTS = {
+    '/edit_search/999': 2,
+    '/view_matches/999': 2,
+}
+
+
+@contextmanager
+def count_queries(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def drop_tables(engine):
+    Base.metadata.drop_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS {SCHEMA_MIGRATIONS_TABLE}"))
+        if engine.dialect.name == 'sqlite':
+            connection.execute(text(f"DROP TABLE IF EXISTS {POST_SEARCH_INDEX}"))
+
+
+def populate(storage):
+    now = datetime.now()
+    storage.upsert_posts([{
+        'post_url': f"https://www.linkedin.com/posts/sample-{i}/",
+        'user_name': f"User {i % 5}",
+        'user_url': f"https://www.linkedin.com/in/user-{i % 5}/",
+        'content': f"Sample post {i} about hiring",
+        'timestamp': now - timedelta(minutes=i),
+    } for i in range(50)])
+    search_id = storage.save_search({'name': 'Hiring', 'type': 'topic', 'keywords': 'hiring', 'notify': False})
+    storage.save_matches(search_id, [{'post_id': post_id} for post_id in storage.get_post_ids_by_keywords(['hiring'])])
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    # web_app opens linkedin_data.db in the working directory on import
+    os.chdir(directory)
+    try:
+        import web_app
+    finally:
+        os.chdir(cwd)
+
+    # Query the database directly, so cached pages do not hide statements. Set TEST_DATABASE_URL to run
+    # against another backend, e.g. a throwaway local PostgreSQL, whose tables are dropped afterwards
+    database_url = os.environ.get('TEST_DATABASE_URL')
+    storage = DatabaseStorage(database_url or f"sqlite:///{os.path.join(directory, 'query_counts.db')}")
+    web_app.storage = storage
+    populate(storage)
+    client = web_app.app.test_client()
+
+    failures = 0
+    pages = [(url, expected, 200) for url, expected in EXPECTED_QUERIES.items()]
+    pages += [(url, expected, 302) for url, expected in EXPECTED_REDIRECTS.items()]
+    for url, expected, expected_status in pages:
+        with count_queries(storage.engine) as statements:
+            response = client.get(url)
+        status = 'OK' if response.status_code == expected_status and len(statements) <= expected else 'FAIL'
+        failures += status == 'FAIL'
+        print(f"{status:4} {url:32} {response.status_code} {len(statements)} queries (expected at most {expected})")
+        if status == 'FAIL':
+            for statement in statements:
+                print(f"       {' '.join(statement.split())[:120]}")
+
+    web_app.jobs.shutdown()
+    if database_url:
+        drop_tables(storage.engine)
+    if failures:
+        print(f"\n{failures} pages failed or ran more queries than expected")
+        sys.exit(1)
+    print("\nAll pages ran a fixed number of queries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test script for search runs.
+This script fills a temporary database, runs the saved searches and checks the matches they write.
+Set TEST_DATABASE_URL to run it against another backend than a temporary SQLite file.
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.search_runner import (run_all_searches, matcher_cache, match_posts, create_worker_pool,
+                                   POOL_MIN_POSTS)
+from modules.storage import DatabaseStorage
+from test_query_counts import drop_tables
+
+
+def add_posts(storage, contents):
+    now = datetime.now()
+    start = storage.get_max_post_id()
+    storage.upsert_posts([{
+        'post_url': f"https://www.linkedin.com/posts/runner-{start + i}/",
+        'user_name': f"User {i % 5}",
+        'user_url': f"https://www.linkedin.com/in/user-{i % 5}/",
+        'content': content,
+        'timestamp': now - timedelta(minutes=i),
+        'likes': (start + i) % 40,
+        'comments': (start + i) % 7,
+    } for i, content in enumerate(contents)])
+
+
+def synthetic_contents(count):
+    words = ["hiring", "python", "remote", "rust", "startup", "cloud", "design", "sales", "data"]
+    return [" ".join(words[(i * k + k) % len(words)] for k in range(1, 2 + i % 5)) for i in range(count)]
+
+
+def matched_contents(storage, search_id):
+    posts = storage.get_posts_by_ids(storage.get_matched_post_ids(search_id))
+    return sorted(post.content for post in posts)
+
+
+def check_recreated_search(storage):
+    # On SQLite a search created in place of a deleted one reuses its ID at version 1, and must not
+    # reuse its matcher; PostgreSQL sequences never hand out an ID twice
+    add_posts(storage, ["java rules", "rust rules"])
+    storage.save_search({'name': 'Python', 'type': 'topic', 'keywords': 'python', 'notify': False})
+    java_id = storage.save_search({'name': 'Java', 'type': 'topic', 'keywords': 'java', 'notify': False})
+    run_all_searches(storage)
+    storage.delete_search(java_id)
+    rust_id = storage.save_search({'name': 'Rust', 'type': 'topic', 'keywords': 'rust', 'notify': False})
+    run_all_searches(storage)
+    reused = rust_id == java_id or storage.engine.dialect.name != 'sqlite'
+    return reused, matched_contents(storage, rust_id) == ["rust rules"]
+
+
+def stored_matches(storage, searches):
+    return {search.id: sorted((match.post_id, match.relevance) for match in storage.iter_matches(search.id))
+            for search in searches}
+
+
+def check_parallel_run(storage):
+    # Worker processes must find and score exactly the matches of an in-process run, for full and partial ranges
+    add_posts(storage, synthetic_contents(2 * POOL_MIN_POSTS))
+    storage.save_search({'name': 'Hiring', 'type': 'topic', 'keywords': 'hiring, remote', 'notify': False})
+    storage.save_search({'name': 'Rust', 'type': 'job', 'keywords': 'rust, cloud', 'notify': False})
+    storage.save_search({'name': 'Authors', 'type': 'user', 'usernames': 'User 1, User 3', 'notify': False})
+    searches = storage.get_all_searches()
+    up_to_post_id = storage.get_max_post_id()
+    # The first search is scanned from the start, the others from watermarks inside the range
+    after_post_ids = {search.id: None if number == 0 else number * POOL_MIN_POSTS // 2
+                      for number, search in enumerate(searches)}
+
+    sequential = match_posts(storage, searches, after_post_ids, 0, up_to_post_id)
+    run_all_searches(storage, full_rebuild=True)
+    written = stored_matches(storage, searches)
+    with create_worker_pool(storage, 2) as pool:
+        parallel = match_posts(storage, searches, after_post_ids, 0, up_to_post_id, workers=2, pool=pool)
+        run_all_searches(storage, full_rebuild=True, workers=2, pool=pool)
+    return parallel == sequential, stored_matches(storage, searches) == written, all(written.values())
+
+
+CHECKS = {
+    'recreated search': check_recreated_search,
+    'parallel run': check_parallel_run,
+}
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    # Set TEST_DATABASE_URL to run against another backend, e.g. a throwaway local PostgreSQL,
+    # whose tables are dropped after each check
+    database_url = os.environ.get('TEST_DATABASE_URL')
+
+    failures = 0
+    for number, (name, check) in enumerate(CHECKS.items()):
+        storage = DatabaseStorage(database_url or f"sqlite:///{os.path.join(directory, f'runner_{number}.db')}")
+        matcher_cache.clear()
+        try:
+            results = check(storage)
+        finally:
+            if database_url:
+                drop_tables(storage.engine)
+            storage.engine.dispose()
+        status = 'OK' if all(results) else 'FAIL'
+        failures += status == 'FAIL'
+        print(f"{status:4} {name}")
+
+    if failures:
+        print(f"\n{failures} checks failed")
+        sys.exit(1)
+    print("\nAll search run checks passed")
+
+
+if __name__ == "__main__":
+    main()
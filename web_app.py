@@ -1,18 +1,32 @@
-from datetime import datetime
+import os
 
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
 
-from modules.storage import DatabaseStorage
-import json
+from modules.api import create_api
+from modules.cache import CachedStorage
+from modules.jobs import JobRunner, job_status
+from modules.metrics import (MetricsRegistry, instrument_app, instrument_engine, instrument_storage,
+                             slow_query_threshold_from_env)
+from modules.notifications import dispatcher_from_env
+from modules.storage import DatabaseStorage, MATCH_SORTS, SORT_RECENT, RECENT_STATS_DAYS, ACTIVITY_DAYS
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'
-storage = DatabaseStorage()
+metrics = MetricsRegistry()
+database = instrument_storage(DatabaseStorage(), metrics)
+# Set SLOW_QUERY_SECONDS to log statements slower than that many seconds
+instrument_engine(database.engine, metrics, slow_query_threshold=slow_query_threshold_from_env())
+instrument_app(app, metrics)
+storage = CachedStorage(database)
+jobs = JobRunner(storage, notifier=dispatcher_from_env(storage))
+app.register_blueprint(create_api(storage), url_prefix='/api')
 
 @app.route('/')
 def index():
     searches = storage.get_all_searches()
-    return render_template('index.html', searches=searches)
+    # Read from the statistics rollups, so the page cost does not grow with the number of matches
+    stats = storage.get_search_stats()
+    return render_template('index.html', searches=searches, stats=stats, recent_days=RECENT_STATS_DAYS)
 
 @app.route('/add_search', methods=['GET', 'POST'])
 def add_search():
@@ -33,9 +47,10 @@ def add_search():
         search_data = {
             "name": name,
             "type": search_type,
-            "usernames": ', '.join(usernames) if usernames else None,
-            "keywords": ', '.join(keywords) if keywords else None,
-            "notify": notify
+            "usernames": usernames,
+            "keywords": keywords,
+            "notify": notify,
+            "interval_minutes": request.form.get('interval_minutes', type=int)
         }
         storage.save_search(search_data)
         flash('Search added successfully!', 'success')
@@ -43,7 +58,7 @@ def add_search():
 
     return render_template('add_search.html')
 
-@app.route('/edit_search/<search_id>', methods=['GET', 'POST'])
+@app.route('/edit_search/<int:search_id>', methods=['GET', 'POST'])
 def edit_search(search_id):
     search = storage.get_search(search_id)
     if not search:
@@ -55,20 +70,24 @@ def edit_search(search_id):
         search_type = request.form['type']
         notify = 'notify' in request.form
 
-        criteria = {'type': search_type}
+        usernames = []
+        keywords = []
         if search_type == 'user':
             usernames = request.form.get('usernames', '').strip()
-            criteria['usernames'] = [u.strip() for u in usernames.split(',') if u.strip()]
+            usernames = [u.strip() for u in usernames.split(',') if u.strip()]
         else:
             keywords = request.form.get('keywords', '').strip()
-            criteria['keywords'] = [k.strip() for k in keywords.split(',') if k.strip()]
+            keywords = [k.strip() for k in keywords.split(',') if k.strip()]
 
+        # Changing the criteria bumps the search version and resets its watermark
         search_data = {
             "id": search_id,
             "name": name,
             "type": search_type,
-            "keywords": json.dumps(criteria),
-            "notify": notify
+            "usernames": usernames,
+            "keywords": keywords,
+            "notify": notify,
+            "interval_minutes": request.form.get('interval_minutes', type=int)
         }
         storage.save_search(search_data)
         flash('Search updated successfully!', 'success')
@@ -76,7 +95,7 @@ def edit_search(search_id):
 
     return render_template('edit_search.html', search=search, search_id=search_id)
 
-@app.route('/delete_search/<search_id>')
+@app.route('/delete_search/<int:search_id>')
 def delete_search(search_id):
     if storage.delete_search(search_id):
         flash('Search deleted successfully!', 'success')
@@ -84,29 +103,48 @@ def delete_search(search_id):
         flash('Error deleting search!', 'error')
     return redirect(url_for('index'))
 
-@app.route('/view_matches/<search_id>')
+@app.route('/view_matches/<int:search_id>')
 def view_matches(search_id):
-    # Get pagination parameters
-    page = request.args.get('page', 1, type=int)
+    # Get pagination parameters; the page number is only used for display, the cursor
+    # determines which rows are fetched
+    cursor = request.args.get('cursor')
+    page = request.args.get('page', 1, type=int) if cursor else 1
     per_page = request.args.get('per_page', 10, type=int)
 
     # Ensure per_page is either 10 or 20
     if per_page not in [10, 20]:
         per_page = 10
 
+    # Matches are ranked by their stored relevance score, never rescored per request
+    sort = request.args.get('sort', SORT_RECENT)
+    if sort not in MATCH_SORTS:
+        sort = SORT_RECENT
+
     search = storage.get_search(search_id)
-    matches, total_matches = storage.get_matches_paginated(search_id, page=page, per_page=per_page)
+    if not search:
+        flash('Search not found!', 'error')
+        return redirect(url_for('index'))
+
+    matches, next_cursor, prev_cursor = storage.get_matches_page(search_id, cursor=cursor, per_page=per_page,
+                                                                 sort=sort)
+    total_matches = storage.count_matches(search_id)
+    activity = storage.get_search_activity(search_id)
 
     # Calculate total pages
-    total_pages = (total_matches + per_page - 1) // per_page
+    total_pages = max((total_matches + per_page - 1) // per_page, page)
 
     return render_template('view_matches.html', 
                           search=search, 
                           matches=matches, 
                           page=page, 
                           per_page=per_page,
+                          sort=sort,
+                          next_cursor=next_cursor,
+                          prev_cursor=prev_cursor,
                           total_matches=total_matches,
-                          total_pages=total_pages)
+                          total_pages=total_pages,
+                          activity=activity,
+                          activity_days=ACTIVITY_DAYS)
 
 @app.route('/search', methods=['GET', 'POST'])
 def search():
@@ -115,49 +153,76 @@ def search():
         search = storage.get_search(search_id)
 
         if search:
-            matched_post_ids = None
-            if search.type == 'user' and search.usernames:
-                usernames = search.usernames.split(',')
-                matched_post_ids = storage.get_post_ids_by_users(usernames)
-            elif (search.type == 'topic' or search.type == 'job') and search.keywords:
-                keywords = search.keywords.split(',')
-                matched_post_ids = storage.get_post_ids_by_users(keywords)
-
-            if matched_post_ids:
-                matches = list(map(lambda post_id: {
-                    "search_id": search.id,
-                    "post_id": post_id,
-                    "matched_at": datetime.now()
-                }, matched_post_ids))
-                storage.save_matches(search.id, matches, True)
-
-            return redirect(url_for('view_matches', search_id=search_id))
+            full_rebuild = 'full_rebuild' in request.form
+            job_id = jobs.submit_search(search.id, full_rebuild=full_rebuild)
+
+            return redirect(url_for('view_job', job_id=job_id))
 
     searches = storage.get_all_searches()
     return render_template('search.html', searches=searches)
 
+@app.route('/run_all_searches', methods=['POST'])
+def run_all():
+    full_rebuild = 'full_rebuild' in request.form
+    job_id = jobs.submit_all_searches(full_rebuild=full_rebuild)
+    return redirect(url_for('view_job', job_id=job_id))
+
+@app.route('/jobs/<int:job_id>')
+def view_job(job_id):
+    job = storage.get_job(job_id)
+    if not job:
+        flash('Job not found!', 'error')
+        return redirect(url_for('index'))
+    return render_template('job.html', job=job_status(job))
+
+@app.route('/jobs/<int:job_id>/status')
+def job_status_json(job_id):
+    job = storage.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_status(job))
+
 @app.route('/posts')
 def posts():
-    # Get pagination parameters
-    page = request.args.get('page', 1, type=int)
+    # Get pagination parameters; the page number is only used for display, the cursor
+    # determines which rows are fetched
+    cursor = request.args.get('cursor')
+    page = request.args.get('page', 1, type=int) if cursor else 1
     per_page = request.args.get('per_page', 10, type=int)
 
     # Ensure per_page is either 10 or 20
     if per_page not in [10, 20]:
         per_page = 10
 
-    # Get posts with pagination
-    posts, total_posts = storage.get_posts(page=page, per_page=per_page)
+    # Get posts with keyset pagination
+    posts, next_cursor, prev_cursor = storage.get_posts_page(cursor=cursor, per_page=per_page)
+    total_posts = storage.count_posts()
 
     # Calculate total pages
-    total_pages = (total_posts + per_page - 1) // per_page
+    total_pages = max((total_posts + per_page - 1) // per_page, page)
 
     return render_template('posts.html', 
                           posts=posts, 
                           page=page, 
                           per_page=per_page,
+                          next_cursor=next_cursor,
+                          prev_cursor=prev_cursor,
                           total_posts=total_posts,
                           total_pages=total_pages)
 
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify(storage.cache_stats())
+
+@app.cli.command('recover-jobs')
+def recover_jobs():
+    """Run the jobs left queued by a stopped server, e.g. before starting WSGI workers."""
+    print(f"Resumed {jobs.recover()} queued jobs")
+    jobs.shutdown()
+
 if __name__ == '__main__':
+    # The debug reloader runs this file twice: in a parent watching the sources and in the
+    # serving child, which has WERKZEUG_RUN_MAIN set. Only the serving process resumes jobs.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        jobs.recover()
     app.run(host='0.0.0.0', port=5000, debug=True)